@@ -0,0 +1,78 @@
+import shaft
+import shaft.Load
+import sys
+import datetime
+import glob
+
+
+# Benchmark: bytes of memory per Game, for the old Game (a plain object with a __dict__, holding whatever strings the
+# history doc parser handed it) against the current compact Game (__slots__ and shared strings).
+# Each history doc is parsed many times over to stand in for an archive of many different officials.
+copies = 50
+sample_files = [f for f in glob.glob('sample/*.xlsx') if shaft.Load.detect_version(f) in (2, 3, 4, 5)]
+
+
+class LegacyGame:
+    """The Game class as it was before it was made compact"""
+    def __init__(self, assn, type, role, age, primacy, date, event):
+        self.assn = None
+        self.type = None
+        self.role = None
+        self.age = None
+        self.date = None
+        self.primacy = None
+        self.event = None
+        if (assn in shaft.config.assns) and (type in shaft.config.types) and (role in shaft.config.roles) and (age is None or age >= 0) and (primacy >= 1):
+            self.assn = assn
+            self.type = type
+            self.role = role
+            self.age = age
+            self.date = date
+            self.primacy = primacy
+            self.event = event
+
+
+def bytes_per_game(officials):
+    """
+    Adds up the memory used by every game, counting each object only once (so shared strings are only counted once)
+    :param officials: list of Officials
+    :return: average number of bytes per game
+    """
+    seen = set()
+    total = 0
+    games = 0
+    for off in officials:
+        for g in off.history:
+            games += 1
+            objects = [g]
+            if hasattr(g, '__dict__'):
+                objects.append(g.__dict__)
+            objects += [g.assn, g.type, g.role, g.age, g.date, g.primacy, g.event]
+            for o in objects:
+                if o is not None and id(o) not in seen:
+                    seen.add(id(o))
+                    total += sys.getsizeof(o)
+    return float(total) / games, games
+
+
+def load(game_class):
+    shaft.Load.Game = game_class
+    officials = []
+    for i in range(copies):
+        for f in sample_files:
+            officials.append(shaft.Load.parse_file(f))
+    return officials
+
+
+if __name__ == '__main__':
+    print "Running"
+    now = datetime.datetime.now()
+
+    before, games = bytes_per_game(load(LegacyGame))
+    after, games = bytes_per_game(load(shaft.Game))
+    print u'{} games from {} officials'.format(games, copies * len(sample_files))
+    print u'Before (plain Game with a __dict__): {:.0f} bytes per game'.format(before)
+    print u'After (compact Game, shared strings): {:.0f} bytes per game'.format(after)
+    print u'Saving: {:.0f}%'.format(100 * (1 - after / before))
+
+    print u'Runtime is {}s'.format(datetime.datetime.now() - now)
@@ -0,0 +1,87 @@
+import shaft
+import shaft.Save
+import os
+import sys
+import copy
+import glob
+import time
+import resource
+import datetime
+import tempfile
+import multiprocessing
+from operator import attrgetter
+import openpyxl
+from openpyxl import Workbook
+
+
+# Benchmark: time to save the results file for a pool of 1000 officials, and the peak memory (RSS) of the process,
+# for the old in-memory workbook against the current write-only one.
+# Each run is in its own process, so the peak memory of one doesn't hide the other.
+pool_size = 1000
+sample_files = [f for f in glob.glob('sample/*.xlsx') if shaft.Load.detect_version(f) in (2, 3, 4, 5)]
+
+
+def legacy_create_results(file_name, officials, model):
+    """create_results as it was before it used a write-only workbook"""
+    wb = Workbook()
+    wb.active.title = "Applicants"
+    wb['Applicants'].append(officials[0].get_summary_header())
+    for off in sorted(officials, key=attrgetter('name')):
+        wb['Applicants'].append(off.get_summary(model.name))
+    for order, r in enumerate(shaft.ref_roles + shaft.nso_roles):
+        wb.create_sheet(r, order + 1)
+        wb[r].append(officials[0].get_role_header())
+        for o in shaft.sort_by_role(officials, r, model.name):
+            wb[r].append(o)
+    wb.create_sheet('model')
+    wb['model'].append(['Model Name: ', model.name])
+    wb.save(file_name)
+
+
+def make_pool():
+    officials = [shaft.load_file(f, datetime.date(2018, 1, 1)) for f in sample_files]
+    pool = []
+    for i in range(pool_size):
+        off = copy.copy(officials[i % len(officials)])
+        off.name = u'{} {:04d}'.format(off.name, i)
+        pool.append(off)
+    return pool
+
+
+def run(write, results):
+    w = shaft.create_weights()
+    pool = make_pool()
+    for off in pool:
+        off.apply_weight_models(w)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    handle, file_name = tempfile.mkstemp(suffix='.xlsx')
+    os.close(handle)
+    # the officials are printed as they're written, which isn't part of the benchmark
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    now = time.time()
+    write(file_name, pool, w[0])
+    elapsed = time.time() - now
+    sys.stdout = stdout
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    os.remove(file_name)
+    results.put((elapsed, before, after))
+
+
+def measure(write):
+    results = multiprocessing.Queue()
+    p = multiprocessing.Process(target=run, args=(write, results))
+    p.start()
+    result = results.get()
+    p.join()
+    return result
+
+
+if __name__ == '__main__':
+    print "Running"
+    print u'lxml installed: {} (openpyxl needs it to stream write-only workbooks)'.format(openpyxl.LXML)
+    for label, write in [('Before (in-memory workbook)', legacy_create_results),
+                         ('After (write-only workbook)', shaft.Save.create_results)]:
+        elapsed, before, after = measure(write)
+        print u'{}: {:.2f}s to save, peak RSS {:.0f}MB ({:.0f}MB more than the loaded pool)'.format(
+            label, elapsed, after / 1024.0, (after - before) / 1024.0)
@@ -0,0 +1,111 @@
+"""
+Keeping a local cache of the Officials extracted from history documents, so that unchanged files don't have to be
+opened and parsed again on every run
+The cache for a directory of history docs lives in the user's own cache directory (see default_cache_dir), not in the
+history directory itself: that's often a shared folder, and the cache is pickles, which nobody else should be able
+to write to (loading a pickle can run code)
+"""
+__author__ = 'hammer'
+
+import os
+import hashlib
+import cPickle as pickle
+
+# bump this whenever the way a history doc is parsed (or the Official/Game objects) changes, so old entries are ignored
+CACHE_VERSION = 6
+
+
+def default_cache_dir(history_dir):
+    """
+    Works out where to keep the cache for a directory of history docs: a directory of its own (named after a hash of
+    the history directory's location) in the user's cache directory, $XDG_CACHE_HOME/shaft or ~/.cache/shaft
+    :param history_dir: directory name
+    :return: directory name
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    name = hashlib.sha1(os.path.abspath(history_dir)).hexdigest()[:16]
+    return os.path.join(root, 'shaft', name)
+
+
+class HistoryCache:
+    """A directory of pickled Officials, one per history document.
+    Each entry is keyed on the file's location, size and modification time, so an edited or replaced file is a miss
+    and gets parsed again. The cached Officials don't depend on the freeze date, which is applied after loading.
+    Unsupported documents are cached too (as None) so they are rejected without being reopened.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def __repr__(self):
+        return "<History cache %s, hits %d, misses %d>" % (self.cache_dir, self.hits, self.misses)
+
+    def key(self, filename):
+        """
+        Works out the cache key for a history document
+        :param filename: file location of the excel file
+        :return: string key
+        """
+        stat = os.stat(filename)
+        return hashlib.sha1(repr((CACHE_VERSION, os.path.abspath(filename), stat.st_size,
+                                  stat.st_mtime))).hexdigest()
+
+    def get(self, key):
+        """
+        Looks up a cached Official, counting the hit or miss
+        :param key: cache key from key()
+        :return: tuple of (found, Official object or None)
+        """
+        try:
+            with open(os.path.join(self.cache_dir, key + '.pickle'), 'rb') as f:
+                off = pickle.load(f)
+        except Exception:
+            # missing or unreadable entries are just treated as a miss
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, off
+
+    def put(self, key, official):
+        """
+        Stores a parsed Official (or None for an unsupported document) in the cache
+        :param key: cache key from key()
+        :param official: Official object or None
+        :return: None
+        """
+        path = os.path.join(self.cache_dir, key + '.pickle')
+        # write to a temporary file first so an interrupted run can't leave a half written entry behind
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(official, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+
+    def prune(self, keys):
+        """
+        Removes the entries that aren't wanted any more (the ones left behind by files that have since been changed or
+        removed), along with any half written ones
+        :param keys: cache keys of the current history docs (from key())
+        :return: number of entries removed
+        """
+        keep = set(k + '.pickle' for k in keys)
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            if name not in keep and (name.endswith('.pickle') or name.endswith('.pickle.tmp')):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def summary(self):
+        """
+        Summarises how well the cache worked
+        :return: string with the hit and miss counts
+        """
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0
+        return u'History cache: {} hits, {} misses ({:.0f}% hit rate)'.format(self.hits, self.misses, rate)
@@ -0,0 +1,244 @@
+"""
+Laying out a pool of officials as columns (an officials table and a games table, with the weighting from each model),
+for analysis elsewhere: as pandas DataFrames, or saved as Parquet or Arrow IPC files
+The category columns (name, association, type, role and event) are dictionary encoded: a column of integer codes into
+a list of the distinct values, which is how Arrow and pandas categoricals keep them
+Each official's games are laid out as arrays once (and kept until their games change), so the pool's tables are
+put together from those arrays without going through the games again. Each game's weight is looked up in the model's
+compiled table for the whole column at once
+NumPy is needed for the columns, pandas for the DataFrames and pyarrow for the files, all imported on first use
+"""
+__author__ = 'hammer'
+
+import weakref
+import datetime
+import collections
+from array import array
+
+import config
+from Offical import ASSN_INDEX, TYPE_INDEX, ROLE_INDEX
+from Matrix import _numpy
+
+assns = config.assns
+types = config.types
+roles = config.roles
+
+# dates are kept as the number of days since 1970-01-01, like Arrow's date32
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+
+# the dictionary encoded columns of the games table
+CATEGORY_COLUMNS = ['name', 'assn', 'type', 'role', 'event']
+
+# each official's games as arrays, for as long as the official is around
+_game_arrays = weakref.WeakKeyDictionary()
+
+
+def official_columns(officials, models=()):
+    """
+    Lays out the officials as columns, one row per official
+    :param officials: list of Officials, with the weight models applied
+    :param models: list of WeightModels (or model names) to include the weighting and qualified games of
+    :return: OrderedDict of column name: list or numpy array of values. The weighting columns are named
+        weight:<model>:<role> and qualified:<model>:<role> (the roles including the NSO families)
+    """
+    numpy = _numpy()
+    columns = collections.OrderedDict()
+    for attribute in ['name', 'refcert', 'nsocert', 'game_tally', 'ref_tally', 'nso_tally']:
+        columns[attribute] = [getattr(o, attribute) for o in officials]
+    for model in models:
+        name = getattr(model, 'name', model)
+        for r in roles + sorted(config.nso_family):
+            columns['weight:' + name + ':' + r] = numpy.array([o.weighting[name][r] for o in officials],
+                                                              dtype=numpy.float64)
+            columns['qualified:' + name + ':' + r] = numpy.array([o.qualified_games[name][r] for o in officials],
+                                                                 dtype=numpy.int32)
+    return columns
+
+
+def game_arrays(official):
+    """
+    Gets an official's games (as at the freeze date) as arrays, laying them out the first time, and again whenever
+    the games have changed (a game added, or a new freeze date)
+    :param official: Official object
+    :return: dict of column name: array of values (codes of -1 for missing values), with the list of distinct events
+        the event codes refer to under 'events', and a list of (position, Game) for games without a code under 'others'
+    """
+    games = official.games
+    key = (official.freeze_date, len(games), id(games[-1]) if games else None)
+    cached = _game_arrays.get(official)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    events = {}
+    arrays = {
+        'code': array('i', [-1 if g.code is None else g.code for g in games]),
+        'assn': array('i', [ASSN_INDEX.get(g.assn, -1) for g in games]),
+        'type': array('i', [TYPE_INDEX.get(g.type, -1) for g in games]),
+        'role': array('i', [ROLE_INDEX.get(g.role, -1) for g in games]),
+        'age': array('i', [-1 if g.age is None else g.age for g in games]),
+        'date': array('i', [g.date.toordinal() - EPOCH for g in games]),
+        'primacy': array('i', [g.primacy for g in games]),
+        'event': array('i', [-1 if g.event is None else events.setdefault(g.event, len(events)) for g in games]),
+        'events': sorted(events, key=events.get),
+        'others': [(i, g) for i, g in enumerate(games) if g.code is None],
+    }
+    _game_arrays[official] = (key, arrays)
+    return arrays
+
+
+def game_columns(officials, models=()):
+    """
+    Lays out the officials' games (as at the freeze date, like the raw dump) as columns, one row per game
+    Compacted officials only have counts, so none of their games are included
+    :param officials: list of Officials
+    :param models: list of WeightModels to include the weight and qualified value of each game for
+    :return: tuple of (OrderedDict of column name: numpy array of values, dict of category column name: list of the
+        distinct values). Category columns hold codes into their list of values (-1 for a missing value), official
+        holds the row of the official in the officials table, date holds days since 1970-01-01, and the weights are
+        named weight:<model> and qualified:<model>
+    """
+    numpy = _numpy()
+    parts = [game_arrays(o) for o in officials]
+    sizes = [len(p['age']) for p in parts]
+    starts = numpy.cumsum([0] + sizes)
+
+    def join(c):
+        return numpy.concatenate([numpy.frombuffer(p[c], dtype=numpy.int32) for p in parts] +
+                                 [numpy.zeros(0, dtype=numpy.int32)])
+
+    # the distinct names and events across the whole pool
+    names = {}
+    events = {}
+    name_codes = [names.setdefault(o.name, len(names)) for o in officials]
+    event_codes = []
+    for p in parts:
+        # each official's own event codes are mapped to the pool's (with -1 staying as -1, at the end)
+        mapping = [events.setdefault(e, len(events)) for e in p['events']] + [-1]
+        event_codes.append(numpy.array(mapping, dtype=numpy.int32)[numpy.frombuffer(p['event'], dtype=numpy.int32)])
+    categories = {'name': sorted(names, key=names.get), 'assn': list(assns), 'type': list(types), 'role': list(roles),
+                  'event': sorted(events, key=events.get)}
+
+    columns = collections.OrderedDict()
+    columns['official'] = numpy.repeat(numpy.arange(len(officials), dtype=numpy.int32), sizes)
+    columns['name'] = numpy.repeat(numpy.array(name_codes, dtype=numpy.int32), sizes)
+    for c in ['assn', 'type', 'role', 'age', 'date', 'primacy']:
+        columns[c] = join(c)
+    columns['event'] = numpy.concatenate(event_codes + [numpy.zeros(0, dtype=numpy.int32)])
+
+    code = join('code')
+    age = columns['age']
+    if models and (age < 0).any():
+        raise ValueError('The freeze date has to be applied to weigh the games')
+    for model in models:
+        ages = len(model.decay)
+        weights, qualifies = model.tables(ages)
+        index = numpy.where(code < 0, 0, code * ages + numpy.minimum(age, ages - 1))
+        columns['weight:' + model.name] = numpy.array(weights, dtype=numpy.float64)[index]
+        columns['qualified:' + model.name] = numpy.array(qualifies, dtype=numpy.int32)[index]
+        # the few games that don't have a code are weighed the usual way
+        for p, start in zip(parts, starts):
+            for i, g in p['others']:
+                columns['weight:' + model.name][start + i] = model.weight(g)
+                columns['qualified:' + model.name][start + i] = model.qualify(g)
+    return columns, categories
+
+
+def _pandas():
+    try:
+        import pandas
+    except ImportError:
+        raise ImportError('pandas is needed to make DataFrames (pip install pandas)')
+    return pandas
+
+
+def to_frames(officials, models=()):
+    """
+    Builds pandas DataFrames of the officials and their games, with the category columns as Categoricals
+    :param officials: list of Officials, with the weight models applied
+    :param models: list of WeightModels
+    :return: tuple of DataFrames (officials, games). The games' official column is the row of the official in the
+        officials frame
+    """
+    pandas = _pandas()
+    officials_frame = pandas.DataFrame(official_columns(officials, models))
+
+    columns, categories = game_columns(officials, models)
+    games_frame = pandas.DataFrame(index=pandas.RangeIndex(len(columns['official'])))
+    for c, values in columns.items():
+        if c in CATEGORY_COLUMNS:
+            games_frame[c] = pandas.Categorical.from_codes(values, categories[c])
+        elif c == 'date':
+            games_frame[c] = values.astype('datetime64[D]')
+        else:
+            games_frame[c] = values
+    return officials_frame, games_frame
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('pyarrow is needed to save Parquet and Arrow files (pip install pyarrow)')
+    return pyarrow
+
+
+def to_arrow(officials, models=()):
+    """
+    Builds Arrow tables of the officials and their games
+    :param officials: list of Officials, with the weight models applied
+    :param models: list of WeightModels
+    :return: tuple of pyarrow Tables (officials, games)
+    """
+    pa = _pyarrow()
+
+    columns = official_columns(officials, models)
+    officials_table = pa.Table.from_arrays([pa.array(v) for v in columns.values()], list(columns.keys()))
+
+    columns, categories = game_columns(officials, models)
+    arrays = []
+    for c, values in columns.items():
+        # missing values (-1 codes and ages) are nulls
+        mask = values < 0 if c in CATEGORY_COLUMNS or c == 'age' else None
+        if mask is not None and not mask.any():
+            mask = None
+        if c in CATEGORY_COLUMNS:
+            codes = pa.array(values, mask=mask)
+            arrays.append(pa.DictionaryArray.from_arrays(codes, pa.array(categories[c], type=pa.string())))
+        elif c == 'date':
+            arrays.append(pa.array(values).cast(pa.date32()))
+        else:
+            arrays.append(pa.array(values, mask=mask))
+    games_table = pa.Table.from_arrays(arrays, list(columns.keys()))
+    return officials_table, games_table
+
+
+def create_parquet(file_base, officials, models=()):
+    """
+    Saves the officials and games tables as Parquet files: <file_base>-officials.parquet and <file_base>-games.parquet
+    :param file_base: start of the file names
+    :param officials: list of Officials, with the weight models applied
+    :param models: list of WeightModels
+    :return: None
+    """
+    _pyarrow()
+    import pyarrow.parquet
+    officials_table, games_table = to_arrow(officials, models)
+    pyarrow.parquet.write_table(officials_table, file_base + '-officials.parquet')
+    pyarrow.parquet.write_table(games_table, file_base + '-games.parquet')
+
+
+def create_arrow(file_base, officials, models=()):
+    """
+    Saves the officials and games tables as Arrow IPC files: <file_base>-officials.arrow and <file_base>-games.arrow
+    :param file_base: start of the file names
+    :param officials: list of Officials, with the weight models applied
+    :param models: list of WeightModels
+    :return: None
+    """
+    pa = _pyarrow()
+    for table, name in zip(to_arrow(officials, models), ['officials', 'games']):
+        sink = pa.OSFile(file_base + '-' + name + '.arrow', 'wb')
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+        sink.close()
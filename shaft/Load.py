@@ -2,21 +2,25 @@
 Loading an Official's game history, using one of several methods:
  1/ from a file (Excel export)
  2/ from a directory of Excel exports
- 2/ from google sheet live (FUTURE)
+ 2/ from google sheet live
  3/ from tournament application sheet (FUTURE)
 """
 __author__ = 'hammer'
 
 from shaft import Official
 from shaft import Game
+from shaft.Cache import HistoryCache, default_cache_dir
+from shaft.Xlsx import XlsxReader, WorkbookReader
+from shaft.Sheets import SheetsClient, SheetValuesReader
 
 import re
 import os
+import zipfile
+import collections
 import datetime
-from dateutil import relativedelta
-from openpyxl import load_workbook
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from openpyxl import utils
-from openpyxl import Workbook
 
 import config
 assns = config.assns
@@ -24,7 +28,6 @@ types = config.types
 roles = config.roles
 
 
-# TODO: FUTURE: add in live google sheet parsing
 # TODO: FUTURE: add in parsing of tournament applicaton sheets (raw or baked)
 # TODO: FUTURE: OPTIONAL: iterate through a file to generate the list of officials
 
@@ -38,7 +41,7 @@ def normalize_cert(cert_string):
     if cert_string is None:
         return 0
     # if it's already a number, return an int (if it's < 1 or greater than 5, return None)
-    elif isinstance(cert_string, float) or isinstance(cert_string, int):
+    elif isinstance(cert_string, (float, int, long)):
         if (cert_string < 1) or (cert_string > 5):
             return 0
         else:
@@ -64,71 +67,150 @@ def normalize_cert(cert_string):
             return 0
 
 
-def get_version(workbook):
+def get_version(reader):
     """
     Check the info tabs and make a determination about which version of the officiating history document is being used.
     Different versions keep information in different places
-    :param workbook: the loaded workbook
+    :param reader: the opened history doc (XlsxReader, WorkbookReader or SheetValuesReader)
     :return: integer with the version number, or None for unknown version
     """
-    if 'Summary' in workbook.get_sheet_names():
-        if 'WFTDA Referee' in workbook.get_sheet_names() or 'WFTDA NSO' in workbook.get_sheet_names():
+    sheet_names = reader.sheet_names()
+    if 'Summary' in sheet_names:
+        if 'WFTDA Referee' in sheet_names or 'WFTDA NSO' in sheet_names:
             # this is an old history doc but it's been modified to change the WFTDA Summary tab name
             return None
-        elif 'Learn More' in workbook.get_sheet_names():
+        elif 'Learn More' in sheet_names:
             # fake out OHDv3 as "valid"
             return 5
-        elif 'Instructions' not in workbook.get_sheet_names():
+        elif 'Instructions' not in sheet_names:
             # this is a new history doc it's been modified to delete the instructions tab (a no no)
             return None
-        elif workbook['Instructions']['A1'].value == 'Loading...':
+        # both cells needed from the Instructions tab are read in one pass
+        (loading, revised) = reader.cells('Instructions', ['A1', 'A104'])
+        if loading == 'Loading...':
             # found one instance where the Instructions tab was showing "loading" - at the moment this will only happen on the new sheets
             return 2
-        elif 'Last Revised 2015' in workbook['Instructions']['A104'].value:
+        elif not isinstance(revised, basestring):
+            # the revision note has been removed or overwritten, so we can't tell which version this is
+            return None
+        elif 'Last Revised 2015' in revised:
             return 2
-        elif 'Last Revised 2016' in workbook['Instructions']['A104'].value:
+        elif 'Last Revised 2016' in revised:
             return 3
-        elif 'Last Revised 2017-01-05' in workbook['Instructions']['A104'].value:
+        elif 'Last Revised 2017-01-05' in revised:
             return 4
         else:
             return None
-    elif 'WFTDA Summary' in workbook.get_sheet_names():
+    elif 'WFTDA Summary' in sheet_names:
         return 1
     else:
         return None
 
 
-def load_file(filename, freezeDate=datetime.date.today()):
+def load_file(filename, freezeDate=datetime.date.today(), cache=None, compact=False):
     """
     Loads an official's history document from an exported Excel file and returns it as a raw Official object
     :param filename: file location of the excel file
     :param freezeDate: the date to measure the age of games
+    :param cache: optional HistoryCache, so an unchanged file is taken from the cache instead of being parsed again
+    :param compact: keep only the game counts the weighting needs, not the games (see Official.compact)
     :return: Official object
     """
-    wb = load_workbook(filename, data_only=True, read_only=True)
-    ver = get_version(wb)
+    if cache is None:
+        off = parse_file(filename)
+    else:
+        key = cache.key(filename)
+        found, off = cache.get(key)
+        if not found:
+            off = parse_file(filename)
+            cache.put(key, off)
+
+    if off is not None and freezeDate is not None:
+        off.apply_freeze_date(freezeDate)
+        if compact:
+            off.compact()
+    return off
+
+
+def detect_version(filename):
+    """
+    Works out the version of a history document without loading the workbook: only the sheet catalog is read, plus
+    the Instructions tab as far as row 104 for the versions that need it
+    :param filename: file location of the excel file
+    :return: integer with the version number, or None for unknown version
+    """
+    try:
+        reader = XlsxReader(filename)
+    except zipfile.BadZipfile:
+        # let openpyxl have a go at anything that isn't a plain xlsx zip
+        reader = WorkbookReader(filename)
+    try:
+        return get_version(reader)
+    finally:
+        reader.close()
+
+
+def parse_file(filename, version=None):
+    """
+    Parses an official's history document from an exported Excel file (bypassing any cache)
+    The games are kept with their raw dates (including any in the "future"), ready for a freeze date to be applied
+    The sheet XML is streamed directly for speed, falling back to openpyxl for files that can't be read that way
+    :param filename: file location of the excel file
+    :param version: the document version, if already known from detect_version
+    :return: Official object, or None for an unsupported document
+    """
+    try:
+        reader = XlsxReader(filename)
+        try:
+            # unsupported documents are rejected here, before any of the history is read
+            if version is None:
+                version = get_version(reader)
+            return parse_history(reader, filename, version)
+        finally:
+            reader.close()
+    except Exception as e:
+        print u'**** Falling back to openpyxl for {}: {}'.format(filename, e)
+
+    reader = WorkbookReader(filename)
+    try:
+        return parse_history(reader, filename, version)
+    finally:
+        reader.close()
+
+
+def parse_history(reader, filename, version=None):
+    """
+    Extracts an official and their games from an opened history document
+    :param reader: the opened history doc (XlsxReader, WorkbookReader or SheetValuesReader)
+    :param filename: file location of the excel file (used in messages, and as a last resort for the name)
+    :param version: the document version, if it's already been worked out
+    :return: Official object, or None for an unsupported document
+    """
+    ver = version
+    if ver is None:
+        ver = get_version(reader)
     if ver == 1:
         # TODO: OPTIONAL: support the old version of the history doc
         print "**** OLD History Doc found: %s" % filename
         return None
     elif (ver == 2) or (ver == 3) or (ver == 4):
         # extract the official's name
-        name = wb['Summary']['C4'].value
+        name = reader.cell('Summary', 'C4')
         if name is None or name == '' or name == '-':
             # fall back to real name
-            name = wb['Summary']['C3'].value
+            name = reader.cell('Summary', 'C3')
         if name is None or name == '' or name == '-':
             # fall back to file name
             name = filename
     elif ver == 5:
         # this is a new OHDv3 doc, and the name is in a different cell:
-        name = wb['Summary']['C3'].value
+        name = reader.cell('Summary', 'C3')
         if name is None or name == '' or name == '-':
             # fall back to preferred name
-            name = wb['Summary']['C2'].value
+            name = reader.cell('Summary', 'C2')
         if name is None or name == '' or name == '-':
             # fall back to legal name
-            name = wb['Summary']['D3'].value
+            name = reader.cell('Summary', 'D3')
         if name is None or name == '' or name == '-':
             # fall back to file name
             name = filename
@@ -147,263 +229,373 @@ def load_file(filename, freezeDate=datetime.date.today()):
 
     # create official object, and fill in metadata
     off = Official(unicode(name))
-    off.refcert = normalize_cert(wb['Summary']['C7'].value)
-    off.nsocert = normalize_cert(wb['Summary']['C8'].value)
+    off.refcert = normalize_cert(reader.cell('Summary', 'C7'))
+    off.nsocert = normalize_cert(reader.cell('Summary', 'C8'))
 
     # go through each game in the Game History tab
-    history = wb['Game History']
-    # TODO: OPTIONAL: Should be made into a function to go through the Other tab... maybe primacy 3, so easily filtered?
-    # TODO: OPTIONAL: like, (date, assn, type, role, secondary_role) = process_row(entry) - that way the Other tab can be processed just fine
-    for entry in history.rows:
-        # skip entirely blank lines
-        if len(entry) == 0:
+    for entry in history_rows(reader, 'Game History'):
+        row = process_row(entry)
+        if row is None:
             continue
-        # skip over lines with no valid date
-        try:
-            date = entry[0].value
-        except Exception as e:
-            print u'Date exception: {}'.format(e)
-            continue
-
-        # the top 3 rows are headers and there might be blank lines, so skip over lines without dates:
-        if not isinstance(date, datetime.date):
-            if isinstance(date, float):
-                try:
-                    date = utils.datetime.from_excel(date)
-                except:
-                    continue
-            else:
-                continue
+        (date, assn, event, type, role, secondary) = row
+        # blank events on this tab have always come through as the text 'None'
+        add_games(off, date, assn, type, role, secondary, unicode(event))
 
-        # calculate the age (in whole years), relative to the freezeDate / today
-        # skipping over games that happen in the "future"
-        date = date.date()
-        if date > freezeDate:
-            continue
-        age = relativedelta.relativedelta(freezeDate, date).years
-
-        if len(entry) < 6:
+    # go through each game in the Other History tab
+    # TODO: OPTIONAL: maybe primacy 3, so easily filtered?
+    if 'Other History' not in reader.sheet_names():
+        return off
+    for entry in history_rows(reader, 'Other History'):
+        row = process_row(entry)
+        if row is None:
             continue
-        assn = entry[6].value
+        (date, assn, event, type, role, secondary) = row
+        add_games(off, date, assn, type, role, secondary, event)
 
-        if assn:
-            assn = assn.strip()
-        # if we don't recognize the association, use 'Other'
-        if assn not in assns:
-            assn = 'Other'
+    return off
 
-        event = unicode(entry[1].value)
-        if event:
-            event = event.strip()
 
-        if len(entry) < 7:
-            continue
-        type = entry[7].value
-        # remove entries with no game type entered
-        if type is None:
-            continue
-        else:
-            type = type.strip()
-            # normalize types in ALL CAPS
-            type = type.capitalize()
-
-        # skip over records that have an invalid type listed
-        if type not in types:
+def history_rows(reader, sheet, blank_rows=None):
+    """
+    Returns the rows of a history tab that can hold games: skipping the header rows, only reading columns A-J, and
+    stopping once there has been a long enough run of rows without a date (the rest of the template is empty)
+    :param reader: the opened history doc (XlsxReader, WorkbookReader or SheetValuesReader)
+    :param sheet: name of the history tab
+    :param blank_rows: number of dateless rows in a row to stop after (defaults to config.history_blank_rows)
+    :return: generator of tuples of the values in columns A-J
+    """
+    if blank_rows is None:
+        blank_rows = config.history_blank_rows
+    blank_run = 0
+    for entry in reader.rows(sheet, min_row=config.history_header_rows + 1, max_col=config.history_columns):
+        if entry[0] is None or entry[0] == '':
+            blank_run += 1
+            if blank_run >= blank_rows:
+                return
             continue
+        blank_run = 0
+        yield entry
 
-        # extract the primary role/position (secondary position is handled below)
-        if len(entry) < 8:
-            continue
-        role = entry[8].value
-        # skip over rows with no position listed
-        if role is None:
-            continue
-        # remove padding whitespace so it can be found in the list of real roles
-        role = role.strip()
-        # skip positions abbreviations that don't actually exist
-        if role not in roles:
-            continue
 
-        # extract the secondary role/position (secondary position is handled below)
-        if len(entry) < 9:
-            continue
-        try:
-            secondary = entry[9].value
-        except Exception as e:
-            print "can't add secondary: {}".format(e)
+def process_row(entry):
+    """
+    Takes a row from one of the history tabs and extracts the details of the game worked in it
+    :param entry: tuple of the values in columns A-J of the row
+    :return: tuple of (date, assn, event, type, role, secondary role), or None if the row doesn't hold a valid game
+    """
+    # skip entirely blank lines
+    if len(entry) == 0:
+        return None
+    date = entry[0]
 
-        # remove padding whitespace so it can be found in the list of real roles
-        if secondary is not None:
-            secondary = secondary.strip()
+    # the top 3 rows are headers and there might be blank lines, so skip over lines without dates:
+    if not isinstance(date, datetime.date):
+        if isinstance(date, float):
+            try:
+                date = utils.datetime.from_excel(date)
+            except:
+                return None
+        else:
+            return None
 
-        # create the primary game
-        off.add_game(Game(assn, type, role, age, 1, date, event))
+    # the age is worked out (and "future" games left out) when a freeze date is applied to the Official
+    date = date.date()
 
-        # create the secondary game
-        secondary_game = Game(assn, type, secondary, age, 2, date, event)
-        if secondary_game.primacy is not None:
-            off.add_game(secondary_game)
+    if len(entry) < 10:
+        return None
+    assn = entry[6]
 
-    # go through each game in the Other History tab
-    if 'Other History' not in wb.get_sheet_names():
-        return off
-    history = wb['Other History']
-    # TODO: OPTIONAL: Should be made into a function
-    for entry in history.rows:
-        # skip entirely blank lines
-        if len(entry) == 0:
-            continue
-        # skip over lines with no valid date
-        try:
-            date = entry[0].value
-        except Exception as e:
-            print u'Date exception: {}'.format(e)
-            continue
+    if assn:
+        assn = assn.strip()
+    # if we don't recognize the association, use 'Other'
+    if assn not in assns:
+        assn = 'Other'
 
-        # the top 3 rows are headers and there might be blank lines, so skip over lines without dates:
-        if not isinstance(date, datetime.date):
-            if isinstance(date, float):
-                try:
-                    date = utils.datetime.from_excel(date)
-                except:
-                    continue
-            else:
-                continue
+    event = entry[1]
+    if isinstance(event, basestring):
+        event = event.strip()
 
-        # calculate the age (in whole years), relative to the freezeDate / today
-        # skipping over games that happen in the "future"
-        date = date.date()
-        if date > freezeDate:
-            continue
-        age = relativedelta.relativedelta(freezeDate, date).years
+    type = entry[7]
+    # remove entries with no game type entered
+    if type is None:
+        return None
+    else:
+        type = type.strip()
+        # normalize types in ALL CAPS
+        type = type.capitalize()
 
-        if len(entry) < 6:
-            continue
-        assn = entry[6].value
+    # skip over records that have an invalid type listed
+    if type not in types:
+        return None
 
-        if assn:
-            assn = assn.strip()
-        # if we don't recognize the association, use 'Other'
-        if assn not in assns:
-            assn = 'Other'
+    # extract the primary role/position (secondary position is handled below)
+    role = entry[8]
+    # skip over rows with no position listed
+    if role is None:
+        return None
+    # remove padding whitespace so it can be found in the list of real roles
+    role = role.strip()
+    # skip positions abbreviations that don't actually exist
+    if role not in roles:
+        return None
 
-        event = entry[1].value
-        if event:
-            event = event.strip()
+    # extract the secondary role/position
+    secondary = entry[9]
+    # remove padding whitespace so it can be found in the list of real roles
+    if secondary is not None:
+        secondary = secondary.strip()
 
-        if len(entry) < 7:
-            continue
-        type = entry[7].value
-        # remove entries with no game type entered
-        if type is None:
-            continue
-        else:
-            type = type.strip()
-            # normalize types in ALL CAPS
-            type = type.capitalize()
+    return date, assn, event, type, role, secondary
 
-        # skip over records that have an invalid type listed
-        if type not in types:
-            continue
 
-        # extract the primary role/position (secondary position is handled below)
-        if len(entry) < 8:
-            continue
-        role = entry[8].value
-        # skip over rows with no position listed
-        if role is None:
-            continue
-        # remove padding whitespace so it can be found in the list of real roles
-        role = role.strip()
-        # skip positions abbreviations that don't actually exist
-        if role not in roles:
-            continue
+def add_games(off, date, assn, type, role, secondary, event):
+    """
+    Adds the games worked in one row of a history tab to the Official: the primary role and, if valid, the secondary role
+    :param off: Official object
+    :return: None
+    """
+    # create the primary game
+    off.add_game(Game(assn, type, role, None, 1, date, event))
 
-        # extract the secondary role/position (secondary position is handled below)
-        if len(entry) < 9:
-            continue
-        try:
-            secondary = entry[9].value
-        except Exception as e:
-            print "can't add secondary: {}".format(e)
+    # create the secondary game
+    secondary_game = Game(assn, type, secondary, None, 2, date, event)
+    if secondary_game.primacy is not None:
+        off.add_game(secondary_game)
 
-        # remove padding whitespace so it can be found in the list of real roles
-        if secondary is not None:
-            secondary = secondary.strip()
 
-        # create the primary game
-        off.add_game(Game(assn, type, role, age, 1, date, event))
+def _load_file_safely(filename):
+    """
+    Wrapper around parse_file, so that a crash in one file can't abort the whole batch
+    :param filename: file location of the excel file
+    :return: tuple of (Official object or None, error string or None)
+    """
+    print filename
+    try:
+        return parse_file(filename), None
+    except Exception as e:
+        print u'**** Error loading {}: {}'.format(filename, e)
+        return None, u'load error: {}: {}'.format(type(e).__name__, e)
 
-        # create the secondary game
-        secondary_game = Game(assn, type, secondary, age, 2, date, event)
-        if secondary_game.primacy is not None:
-            off.add_game(secondary_game)
 
-    return off
+# the reject reason for a history doc that isn't a version that can be read
+UNSUPPORTED = u'unsupported document version'
 
 
-def load_files_from_dir(history_dir, freezeDate=datetime.date.today()):
+def load_history(filename, cache=None):
     """
-    Open the given directory and grab all the Officiating history excel files and load them
+    Loads a single history doc for one of the loaders (a directory, the watcher or the store): taken from the cache if
+    it's there, otherwise parsed, without letting a crash escape, and cached (files that crashed aren't cached, so
+    they're tried again next time)
+    No freeze date is applied, so the Official has its whole history
+    :param filename: file location of the excel file
+    :param cache: optional HistoryCache
+    :return: tuple of (Official object or None, reject reason or None)
+    """
+    key = None
+    if cache is not None:
+        key = cache.key(filename)
+        found, off = cache.get(key)
+        if found:
+            return off, None if off is not None else UNSUPPORTED
+    off, error = _load_file_safely(filename)
+    if cache is not None and error is None:
+        cache.put(key, off)
+    if error is None and off is None:
+        error = UNSUPPORTED
+    return off, error
+
+
+def list_history_files(history_dir):
+    """
+    Lists the Officiating history excel files in the given directory
     :param history_dir: directory name
-    :param freezeDate: the date to measure the age of games
-    :return: list of Officials
+    :return: list of file names (without the directory)
     """
-    histories = []
-    rejects = []
     # get the list of history docs to process
     file_list = os.walk(history_dir).next()[2]
     # remove files that start with a . like .DS_Store and .bashrc etc
     file_list = [f for f in file_list if not f[0] == '.']
 
+    # skip over files that begin with _ (such as output from this tool),
+    # filenames that aren't long enough to be real files and files that do not end with a .xlsx
+    return [f for f in file_list if f[0] != '_' and len(f) >= 6 and f[-5:] == '.xlsx']
+
+
+def iter_files_from_dir(history_dir, freezeDate=datetime.date.today(), workers=1, cache=None, compact=False):
+    """
+    Open the given directory and load the Officiating history excel files one by one, handing each one back as soon as
+    it's loaded so the officials can be processed as a stream (without holding the whole pool in memory)
+    With several workers, only a few files are in flight at a time, so memory stays bounded however many files there are
+    :param history_dir: directory name
+    :param freezeDate: the date to measure the age of games (or None to leave it to be applied later)
+    :param workers: number of processes to load the files with (1 loads them one at a time in this process)
+    :param cache: optional HistoryCache to skip parsing unchanged files, or True to keep one for the directory in the
+        user's cache directory (see default_cache_dir), pruned of entries for files that have changed or gone
+    :param compact: keep only the game counts the weighting needs, not the games (see Official.compact)
+    :return: generator of tuples (file name, Official or None, reject reason or None), in file list order
+    """
+    file_list = list_history_files(history_dir)
     print file_list
-    for filename in file_list:
-        # skip over files that begin with _ (such as output from this tool)
-        if filename[0] == '_':
-            continue
-        # skip over filenames that aren't long enough to be real files
-        elif len(filename) < 6:
-            continue
-        # skip files that do not end with a .xlsx
-        elif filename[-5:] != '.xlsx':
-            continue
-        print filename
-        h = load_file(history_dir + '/' + filename, freezeDate)
+    # the directory's own cache is pruned once every file has been through it (not a cache that's been passed in,
+    # which might be shared with other directories)
+    prune = cache is True
+    if cache is True:
+        cache = HistoryCache(default_cache_dir(history_dir))
+    keys = []
+
+    pool = None
+    if workers > 1 and len(file_list) > 1:
+        pool = multiprocessing.Pool(min(workers, len(file_list)))
+    # files waiting to be handed back: (file name, cache key, pending async result, or the result if already loaded)
+    pending = collections.deque()
+    window = workers * 2
+
+    def finish(filename, key, async_result, result):
+        if async_result is not None:
+            result = async_result.get()
+            # files that crashed aren't cached, so they're tried again next time
+            if cache is not None and (result[0] is not None or result[1] == UNSUPPORTED):
+                cache.put(key, result[0])
+        h, error = result
+        if error is not None:
+            return filename, None, error
+        if freezeDate is not None:
+            h.apply_freeze_date(freezeDate)
+            if compact:
+                h.compact()
+        return filename, h, None
+
+    try:
+        for filename in file_list:
+            path = history_dir + '/' + filename
+            key = None
+            if cache is not None:
+                key = cache.key(path)
+                keys.append(key)
+            if pool is None:
+                pending.append((filename, key, None, load_history(path, cache)))
+            else:
+                # the cache is looked up here, so only the files that aren't in it go to the workers (and they're
+                # cached as they come back)
+                found = False
+                if cache is not None:
+                    found, h = cache.get(key)
+                if found:
+                    pending.append((filename, key, None, (h, None if h is not None else UNSUPPORTED)))
+                else:
+                    pending.append((filename, key, pool.apply_async(load_history, (path,)), None))
+
+            # hand back everything that's ready at the front of the queue (waiting if too many files are in flight)
+            while pending and (len(pending) > window or pending[0][2] is None or pending[0][2].ready()):
+                yield finish(*pending.popleft())
+
+        while pending:
+            yield finish(*pending.popleft())
+    finally:
+        if pool is not None:
+            # stops any work still in flight if the caller gave up early
+            pool.terminate()
+            pool.join()
+
+    if cache is not None:
+        if prune:
+            cache.prune(keys)
+        print cache.summary()
+
+
+def load_files_from_dir(history_dir, freezeDate=datetime.date.today(), workers=1, cache=None, compact=False):
+    """
+    Open the given directory and grab all the Officiating history excel files and load them
+    :param history_dir: directory name
+    :param freezeDate: the date to measure the age of games (or None to leave it to be applied later)
+    :param workers: number of processes to load the files with (1 loads them one at a time in this process)
+    :param cache: optional HistoryCache to skip parsing unchanged files, or True to keep one for the directory in the
+        user's cache directory (see default_cache_dir), pruned of entries for files that have changed or gone
+    :param compact: keep only the game counts the weighting needs, not the games (see Official.compact)
+    :return: list of Officials, list of rejects (tuples of file name and reason)
+    """
+    histories = []
+    rejects = []
+    for filename, h, reason in iter_files_from_dir(history_dir, freezeDate, workers, cache, compact):
         if h is not None:
             histories.append(h)
         else:
-            rejects.append((filename, "unsupported document version"))
+            rejects.append((filename, reason))
 
     return histories, rejects
 
 
-import gspread
-from oauth2client.client import AccessTokenCredentials
+def _load_google_sheet_safely(job):
+    """
+    Wrapper around loading a single live history doc, so that a failure in one doc can't abort the whole batch
+    :param job: tuple of (SheetsClient, URL of the history doc)
+    :return: tuple of (Official object or None, error string or None)
+    """
+    client, url = job
+    print url
+    try:
+        reader = SheetValuesReader(client, url)
+        return parse_history(reader, url), None
+    except Exception as e:
+        print u'**** Error loading {}: {}'.format(url, e)
+        return None, u'load error: {}: {}'.format(type(e).__name__, e)
 
 
-def load_google_sheet(url, token, freezeDate=datetime.date.today()):
+def load_google_sheets(urls, token=None, freezeDate=datetime.date.today(), concurrency=8, client=None):
     """
-    Loads an official's history document from a live google sheet and returns it as a raw Official object
-    :param url: the URL of history doc
-    :param token: the security token required
-    :param freezeDate: the date to measure the age of games
-    :return: Official object
+    Loads a list of officials' history documents from live google sheets, several at a time
+    :param urls: list of URLs (or IDs) of the history docs
+    :param token: OAuth access token with read access to the docs
+    :param freezeDate: the date to measure the age of games (or None to leave it to be applied later)
+    :param concurrency: the most history docs to fetch at the same time
+    :param client: optional SheetsClient to use instead of one made from the token (eg to set an API key or transport)
+    :return: list of Officials, list of rejects (tuples of URL and reason), both in the same order as the URLs
     """
-    access_token = "ya29.Ci8uA-oQLfvo_NIVOh6ayWiNadGSt52xcN8TUY97ywsBMrwJOFdiXr_yeTdbdXXh0A"
-    refresh_token = "1/EoXmQmxwjPGsGsyxB7wJ630dLVJrrU29Ff3lcZ8aubE"
-    mike_url = "https://docs.google.com/spreadsheets/d/1kG9QTdus7LbpZP-3L9fNvwQ0nVpUUXyw7m7hpKSBH-E/edit#gid=2008460745"
-    aggie_url = "https://docs.google.com/spreadsheets/d/1f9do7TIC31ktgCww0Sw1kvEl7bQc6RPCMExFhfR7cso/edit#gid=1988016352"
-    clobber_url = "https://docs.google.com/spreadsheets/d/1kbScLowzIzpDkKtr9eO9MvWnaGdG3V4RDzQqV_KOcso/edit#gid=1988016352"
-    urls = [mike_url, aggie_url, clobber_url]
-    creds = AccessTokenCredentials(access_token, 'Agent/1.0')
-    gs = gspread.authorize(creds)
-    wb = gs.open_by_url(urls[url])
-
-    return wb
+    if client is None:
+        client = SheetsClient(token)
+    histories = []
+    rejects = []
 
+    jobs = [(client, url) for url in urls]
+    if concurrency > 1 and len(jobs) > 1:
+        # the time goes on waiting for the API, so threads are enough to overlap the requests
+        pool = ThreadPool(min(concurrency, len(jobs)))
+        try:
+            results = pool.map(_load_google_sheet_safely, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_load_google_sheet_safely, jobs)
+
+    for url, (h, error) in zip(urls, results):
+        if error is not None:
+            rejects.append((url, error))
+        elif h is not None:
+            if freezeDate is not None:
+                h.apply_freeze_date(freezeDate)
+            histories.append(h)
+        else:
+            rejects.append((url, UNSUPPORTED))
 
+    return histories, rejects
 
 
+def load_google_sheet(url, token=None, freezeDate=datetime.date.today(), client=None):
+    """
+    Loads an official's history document from a live google sheet and returns it as a raw Official object
+    :param url: the URL (or ID) of history doc
+    :param token: OAuth access token with read access to the doc
+    :param freezeDate: the date to measure the age of games
+    :param client: optional SheetsClient to use instead of one made from the token
+    :return: Official object, or None for an unsupported document
+    """
+    if client is None:
+        client = SheetsClient(token)
+    off = parse_history(SheetValuesReader(client, url), url)
+    if off is not None and freezeDate is not None:
+        off.apply_freeze_date(freezeDate)
+    return off
 
 
 # Some nifty bits of code:
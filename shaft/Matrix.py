@@ -0,0 +1,142 @@
+"""
+Weighting a whole pool of officials against many weight models at once, with NumPy
+Each official's games are summed up as a count for each count key (role, code and age, see Offical.py), and each model
+as a weight (and qualified flag) for each code and age, so every score for every official, role and model comes out
+of one matrix product. Handy for tuning models, where dozens of candidates are tried against the same pool
+NumPy is only needed when this is used, so it's imported on first use
+"""
+__author__ = 'hammer'
+
+import config
+from Offical import CODES, AGE_BUCKETS, count_key, combine_roles
+
+roles = config.roles
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('NumPy is needed to weigh officials with matrices (pip install numpy)')
+    return numpy
+
+
+def _rebucket(key, ages):
+    """
+    Moves a count key from the standard number of age buckets to fewer of them
+    """
+    if ages == AGE_BUCKETS:
+        return key
+    if ages > AGE_BUCKETS:
+        raise ValueError(u'Compacted officials only have {} age buckets, not {}'.format(AGE_BUCKETS, ages))
+    rest, age = divmod(key, AGE_BUCKETS)
+    return rest * ages + min(age, ages - 1)
+
+
+class CountMatrix:
+    """The game counts of a pool of officials, ready to be weighted by any number of models.
+    Counts are an array of (officials x roles) x (code, age), built once from the officials' games (so the freeze date
+    has to be applied first), or taken straight from the counts of compacted officials. Games that don't fit the known
+    categories aren't counted, and are weighed the usual way
+    """
+
+    def __init__(self, officials, ages=AGE_BUCKETS):
+        numpy = _numpy()
+        self.officials = list(officials)
+        self.ages = ages
+        width = len(roles) * CODES * ages
+        keys = []
+        numbers = []
+        self.others = []
+        for i, off in enumerate(self.officials):
+            base = i * width
+            games = off.games
+            if off.counts is not None:
+                for key, n in off.counts.iteritems():
+                    keys.append(base + _rebucket(key, ages))
+                    numbers.append(n)
+                games = [g for g in games if count_key(g) is None]
+            for game in games:
+                key = count_key(game, ages)
+                if key is None:
+                    if game.role in roles:
+                        self.others.append((i, game))
+                else:
+                    keys.append(base + key)
+                    numbers.append(1)
+        # only the (code, age) columns that some official has games in are kept, as most combinations never come up
+        # (and counts are kept as floats, so the products go through the fast (BLAS) matrix multiply)
+        keys = numpy.array(keys, dtype=numpy.int64)
+        rows = len(self.officials) * len(roles)
+        self.columns, column = numpy.unique(keys % (CODES * ages), return_inverse=True)
+        counts = numpy.bincount(keys // (CODES * ages) * len(self.columns) + column,
+                                numpy.array(numbers, dtype=numpy.float64), minlength=rows * len(self.columns))
+        self.counts = counts.reshape(rows, len(self.columns))
+
+    def __repr__(self):
+        games = int(self.counts.sum()) + len(self.others)
+        return "<Count matrix, officials %d, games %d>" % (len(self.officials), games)
+
+    def model_matrices(self, models):
+        """
+        :param models: list of WeightModels
+        :return: tuple of arrays (weights, qualified), each (code, age) x models, for the columns of the counts
+        """
+        numpy = _numpy()
+        tables = [model.tables(self.ages) for model in models]
+        weights = numpy.array([t[0] for t in tables], dtype=numpy.float64).reshape(len(models), -1)
+        qualified = numpy.array([t[1] for t in tables], dtype=numpy.float64).reshape(len(models), -1)
+        weights = weights[:, self.columns].T
+        qualified = qualified[:, self.columns].T
+        return weights, qualified
+
+    def evaluate(self, models):
+        """
+        Weighs every official in every role for every model, unrounded
+        :param models: list of WeightModels
+        :return: tuple of arrays (weights, qualified), each officials x roles x models
+        """
+        numpy = _numpy()
+        weights, qualified = self.model_matrices(models)
+        shape = (len(self.officials), len(roles), len(models))
+        weights = self.counts.dot(weights).reshape(shape)
+        qualified = numpy.rint(self.counts.dot(qualified)).astype(numpy.int64).reshape(shape)
+
+        # the few games that don't fit the count keys
+        for i, game in self.others:
+            r = roles.index(game.role)
+            for m, model in enumerate(models):
+                weights[i, r, m] += model.weight(game)
+                qualified[i, r, m] += model.qualify(game)
+        return weights, qualified
+
+    def apply(self, models):
+        """
+        Weighs the pool with the models and puts the results in each Official's weighting and qualified games, just
+        like Official.apply_weight_models
+        The weights are added up in a different order to apply_weight_models, so a total that lands right on a
+        rounding boundary (like 15.995) can round the other way
+        :param models: list of WeightModels
+        :return: None
+        """
+        weights, qualified = self.evaluate(models)
+        weights = weights.tolist()
+        qualified = qualified.tolist()
+        for i, off in enumerate(self.officials):
+            for m, model in enumerate(models):
+                off.weighting[model.name] = dict((r, round(weights[i][j][m], 2)) for j, r in enumerate(roles))
+                off.qualified_games[model.name] = dict((r, qualified[i][j][m]) for j, r in enumerate(roles))
+                combine_roles(off.weighting[model.name], off.qualified_games[model.name])
+
+
+def matrix_weight_models(officials, models, ages=AGE_BUCKETS):
+    """
+    Applies the weight models to a whole pool of officials in one go (see CountMatrix)
+    :param officials: list of Officials, with the freeze date applied
+    :param models: list of WeightModels to be applied
+    :param ages: number of age buckets, which has to cover the longest age decay in the models
+    :return: the CountMatrix, so more models can be tried against the same counts
+    """
+    matrix = CountMatrix(officials, ages)
+    matrix.apply(models)
+    return matrix
@@ -5,8 +5,11 @@ Possibly ALL the weighting models can be applied on input and just used as neede
 """
 __author__ = 'hammer'
 
-from itertools import ifilter, ifilterfalse
+import heapq
+from bisect import bisect_left
+from itertools import ifilter, ifilterfalse, izip
 from operator import attrgetter, methodcaller
+from dateutil import relativedelta
 
 # TODO: OPTIONAL: introspect certain information... such as "how many years they've been officiating sanctioned play"
 # TODO: OPTIONAL: FUTURE: keep track (and a count) of the distinct tournament names as a guide to how well travelled they are
@@ -23,9 +26,13 @@ class Official:
     """The basic official object.
     Contains data about that official, and the set of games they've worked.
     It contains:
-        a list of games officiated:
+        the full history of games officiated, as parsed (independent of any freeze date)
+        a list of games officiated up to the freeze date, with their age relative to it:
             note that secondary positions officiated count here
+        an index of those games by role (all games, and primary position games only), kept up to date as games are added
         the processed weighting in each role (and NSO family), including secondary positions
+    Compacted officials (see compact) keep a count of games for each count key instead of the Games themselves
+    Weight models can be registered (see register_models), so the weighting is kept up to date as each game is added
     """
 
     def __init__(self, name):
@@ -33,24 +40,58 @@ class Official:
         self.name = name
         self.refcert = 0
         self.nsocert = 0
+        self.history = []
+        self.freeze_date = None
         self.games = []
+        self.games_by_role = {}
+        self.primary_games_by_role = {}
         self.game_tally = 0
         self.ref_tally = 0
         self.nso_tally = 0
         self.weighting = {}
         self.qualified_games = {}
+        self.counts = None
+        self.models = []
+        self.raw_weighting = {}
 
     def __repr__(self):
         return "<name: %r, refcert %d, nsocert: %d, games %d>" % (self.name, self.refcert, self.nsocert, self.game_tally)
 
     def add_game(self, game):
+        """
+        Adds a game to the history. If a freeze date has been applied, the game is aged against it (and games in the
+        "future" are kept in the history but left out of the games and tallies)
+        :param game: Game object
+        :return: None
+        """
+        if self.history is not None:
+            self.history.append(game)
+        self._count_game(game)
+
+    def _count_game(self, game):
         """
         Adds a game to the tally. If it's a primary position game, update Ref, NSO and total tallies
         Note that secondary and tertiary positions don't count for total counts
         :param game: Game object
         :return: None
         """
-        self.games.append(game)
+        if self.freeze_date is not None:
+            if game.date > self.freeze_date:
+                return
+            game.age = game_age(game.date, self.freeze_date)
+        key = None
+        if self.counts is not None:
+            key = count_key(game)
+            if key is not None:
+                self.counts[key] = self.counts.get(key, 0) + 1
+        # compacted officials only keep the games that can't be counted
+        if key is None or self.history is not None:
+            self.games.append(game)
+            self.games_by_role.setdefault(game.role, []).append(game)
+            if game.primacy == 1:
+                self.primary_games_by_role.setdefault(game.role, []).append(game)
+        if self.raw_weighting:
+            self._weigh_game(game)
         if game.primacy == 1:
             self.game_tally += 1
             if game.role in config.ref_roles:
@@ -58,49 +99,188 @@ class Official:
             elif game.role in config.nso_roles:
                 self.nso_tally += 1
 
+    def apply_freeze_date(self, freezeDate):
+        """
+        Measures the age of every game in the history relative to the freeze date, leaving out games in the "future".
+        The games and tallies are rebuilt, so the same Official can be re-evaluated at any number of freeze dates
+        Any weighting already applied is cleared, since it depends on the ages of the games
+        :param freezeDate: the date to measure the age of games
+        :return: None
+        """
+        if self.history is None:
+            raise ValueError(u'{} has been compacted without keeping the games, so the freeze date is fixed'.format(
+                self.name))
+        self.freeze_date = freezeDate
+        self.games = []
+        self.games_by_role = {}
+        self.primary_games_by_role = {}
+        self.game_tally = 0
+        self.ref_tally = 0
+        self.nso_tally = 0
+        self.weighting = {}
+        self.qualified_games = {}
+        self.raw_weighting = {}
+        if self.counts is not None:
+            self.counts = {}
+        for game in self.history:
+            self._count_game(game)
+        if self.models:
+            self.register_models(self.models)
+
+    def compact(self, keep_games=False):
+        """
+        Sums up the games as a count for each count key (role, code and age), which is all the weighting needs, so the
+        official takes a few kilobytes rather than a list of Games. The tallies and weighting work just the same
+        Unless the games are kept as well, the freeze date can't be changed afterwards, and the games (with their dates
+        and events) are gone, apart from any that don't fit the count keys
+        :param keep_games: keep the history and games alongside the counts
+        :return: None
+        """
+        if self.freeze_date is None:
+            raise ValueError(u'{} needs a freeze date before it can be compacted'.format(self.name))
+        if self.counts is not None and self.history is None:
+            # already compacted, and the games are gone, so the counts are all there is
+            if keep_games:
+                raise ValueError(u'{} has been compacted without keeping the games'.format(self.name))
+            return
+        # rebuilt from the whole history, as the games may already be down to the ones that can't be counted
+        games = self.history
+        self.counts = {}
+        if not keep_games:
+            self.history = None
+        self.games = []
+        self.games_by_role = {}
+        self.primary_games_by_role = {}
+        self.game_tally = 0
+        self.ref_tally = 0
+        self.nso_tally = 0
+        self.raw_weighting = {}
+        for game in games:
+            self._count_game(game)
+        if self.models:
+            self.register_models(self.models)
+
     def get_games(self, role, primary_only=False):
         """
-        Returns a list of games of the role(s) queried
-        :param role: string of the role name, or a list of strings
+        Returns a list of games of the role(s) queried, looked up in the role index rather than scanning every game
+        :param role: string of the role name, or a list of strings (the games are then grouped by role, in that order)
         :param primary_only: boolean. If yes, then return only primary roles otherwise return primary and secondary roles
         :return: list of matching Games
         """
         if not isinstance(role, list):
                 role = [role]
         if primary_only:
-            return list(ifilter(lambda x: attrgetter('role')(x) in role, list(ifilter(lambda x: attrgetter('primacy')(x) == 1, self.games))))
+            index = self.primary_games_by_role
         else:
-            return list(ifilter(lambda x: attrgetter('role')(x) in role, self.games))
+            index = self.games_by_role
+        games = []
+        for r in role:
+            games.extend(index.get(r, []))
+        return games
 
     def apply_weight_models(self, models):
         """
         Take in a list of WeightModels and process each, adding the result under the model name (rounding off to 2 decimal places)
+        The games are walked once, with every model accumulated at the same time, rather than once per model.
+        Games only differ in weight by role, association, type, primacy and age, so each model weighs each distinct
+        combination once and the rest of the games with that combination reuse the result
+        For compacted officials the counts are weighed instead (the totals are added up in a different order, so one
+        that lands right on a rounding boundary can round the other way)
         :param models: list of WeightModels to be applied to the Official
         """
-        for model in models:
-            self.weighting[model.name] = {}
-            self.qualified_games[model.name] = {}
-
-            # iterate through each role for processing
-            for r in roles:
-                # lambda magic to reduce through the list of games in that role, and apply weight, and sum the weights
-                self.weighting[model.name][r] = round(reduce(lambda a,b: a + model.weight(b), self.get_games(r), 0), 2)
-                self.qualified_games[model.name][r] = reduce(lambda a,b: a + model.qualify(b), self.get_games(r), 0)
-
-            # CH and H count as the same role, but H doesn't get a CH bonus, so they should be added to the CH slot
-            self.weighting[model.name]['CHR'] += self.weighting[model.name]['HR']
-            self.qualified_games[model.name]['CHR'] += self.qualified_games[model.name]['HR']
-            self.weighting[model.name]['CHNSO'] += self.weighting[model.name]['HNSO']
-            self.qualified_games[model.name]['CHNSO'] += self.qualified_games[model.name]['HNSO']
-
-            # add in the weighting for each NSO family
-            for f in config.nso_family:
-                self.weighting[model.name][f] = 0
-                self.qualified_games[model.name][f] = 0
-                for r in config.nso_family[f]:
-                    self.weighting[model.name][f] += self.weighting[model.name][r]
-                    self.qualified_games[model.name][f] += self.qualified_games[model.name][r]
-                self.weighting[model.name][f] = round(self.weighting[model.name][f], 2)
+        for model, weights, qualified in self._weigh_games(models):
+            self._finish_weighting(model, weights, qualified)
+
+    def register_models(self, models):
+        """
+        Applies the WeightModels (like apply_weight_models), and keeps them, so from then on each game added updates
+        the weighting straight away (only the game's role, its CH slot and NSO family are worked out again)
+        The unrounded totals are kept in raw_weighting, so the weighting is exactly what apply_weight_models would give
+        Register the models again after changing them
+        :param models: list of WeightModels
+        :return: None
+        """
+        self.models = list(models)
+        self.raw_weighting = {}
+        for model, weights, qualified in self._weigh_games(self.models):
+            self.raw_weighting[model.name] = (weights, qualified)
+            self._finish_weighting(model, weights, qualified)
+
+    def _finish_weighting(self, model, weights, qualified):
+        """
+        Rounds off the totals for a model, and merges the CH roles and adds up the NSO families
+        :return: None
+        """
+        self.weighting[model.name] = dict((r, round(weights[r], 2)) for r in roles)
+        self.qualified_games[model.name] = dict(qualified)
+        combine_roles(self.weighting[model.name], self.qualified_games[model.name])
+
+    def _weigh_game(self, game):
+        """
+        Adds a game to the weighting of each registered model
+        :param game: Game object
+        :return: None
+        """
+        r = game.role
+        if r not in ROLE_INDEX:
+            return
+        for model in self.models:
+            weights, qualified = self.raw_weighting[model.name]
+            weighting = self.weighting[model.name]
+            qualified_games = self.qualified_games[model.name]
+            weights[r] += model.weight(game)
+            qualified[r] += model.qualify(game)
+
+            # the same steps as _finish_weighting, but only for the slots this game's role goes into
+            weighting[r] = round(weights[r], 2)
+            qualified_games[r] = qualified[r]
+            for ch, h in HEAD_ROLES:
+                if r == ch or r == h:
+                    weighting[ch] = round(weights[ch], 2) + round(weights[h], 2)
+                    qualified_games[ch] = qualified[ch] + qualified[h]
+            if r in ROLE_FAMILIES:
+                add_family(weighting, qualified_games, ROLE_FAMILIES[r])
+
+    def _weigh_games(self, models):
+        """
+        Adds up the unrounded weighting and qualified games in each role for each model
+        :param models: list of WeightModels
+        :return: list of tuples (model, dict of role: weight, dict of role: qualified games)
+        """
+        totals = [(model, dict((r, 0) for r in roles), dict((r, 0) for r in roles)) for model in models]
+        games = self.games
+        if self.counts is not None:
+            # compacted officials: each count key is weighed once and multiplied up by its count
+            for model in models:
+                if len(model.decay) > AGE_BUCKETS:
+                    raise ValueError(u'Model {} decays over more years than are counted ({})'.format(model.name,
+                                                                                                   AGE_BUCKETS))
+            for key in sorted(self.counts):
+                role, code, age = split_count_key(key)
+                n = self.counts[key]
+                for model, weights, qualified in totals:
+                    weights[role] += n * model.weight_code(code, age)
+                    qualified[role] += n * model.qualify_code(code, age)
+            games = [g for g in games if count_key(g) is None]
+
+        seen = {}
+        for game in games:
+            key = (game.role, game.assn, game.type, game.primacy, game.age)
+            values = seen.get(key)
+            if values is None:
+                values = seen[key] = [(model.weight(game), model.qualify(game)) for model in models]
+            r = game.role
+            for (wgt, qual), (model, weights, qualified) in izip(values, totals):
+                weights[r] += wgt
+                qualified[r] += qual
+        return totals
+
+    def get_events(self):
+        """
+        Lists the events the official has worked games at
+        :return: list of [name, year, event name, type of event, role] (as create_events expects), one per game with an event
+        """
+        return [[self.name, g.date.year, g.event, g.type, g.role] for g in self.games if g.event]
 
     def get_weight(self, role, model):
         """
@@ -157,13 +337,89 @@ class Official:
         return ['Name', 'Cert', 'Weighted Value', 'Qualified Games']
 
 
-class Game:
+# the CH role slots and the H roles that are added to them (without the CH bonus), and the NSO family total each role
+# goes into (H roles going in with their CH slot)
+HEAD_ROLES = [('CHR', 'HR'), ('CHNSO', 'HNSO')]
+ROLE_FAMILIES = dict((r, f) for f in config.nso_family for r in config.nso_family[f])
+ROLE_FAMILIES.update((h, ROLE_FAMILIES[ch]) for ch, h in HEAD_ROLES if ch in ROLE_FAMILIES)
+
+
+# the one shared copy of each category value (association, type and role), and of each event name seen so far
+_categories = dict((v, v) for v in assns + types + roles)
+_events = {}
+
+# primacies 1-3 (primary, secondary and tertiary positions), the crew head roles that get the CH uplift, and the
+# position of each association and type in the config (which the game codes are made from)
+PRIMACIES = 3
+CH_ROLES = ['CHR', 'CHNSO']
+ASSN_INDEX = dict((a, i) for i, a in enumerate(assns))
+TYPE_INDEX = dict((t, i) for i, t in enumerate(types))
+
+
+def game_code(assn, type, primacy, role):
+    """
+    Works out the code for a game: a number that identifies everything about the game that the weighting depends on,
+    apart from its age (the association, type, primacy and whether it's a crew head role)
+    :return: integer code, or None for a game that doesn't fit the known categories
+    """
+    if assn not in ASSN_INDEX or type not in TYPE_INDEX or primacy not in range(1, PRIMACIES + 1):
+        return None
+    return ((ASSN_INDEX[assn] * len(types) + TYPE_INDEX[type]) * PRIMACIES + primacy - 1) * 2 + (role in CH_ROLES)
+
+
+# count keys: games with the same role, code and age (capped at the number of age buckets) weigh the same in every
+# model, so an official's games can be summed up as a count per key
+CODES = len(assns) * len(types) * PRIMACIES * 2
+AGE_BUCKETS = config.age_buckets
+ROLE_INDEX = dict((r, i) for i, r in enumerate(roles))
+
+
+def count_key(game, ages=AGE_BUCKETS):
+    """
+    Works out the count key for a game (laid out as [role][code][age])
+    :param game: Game object, with its age measured
+    :param ages: number of age buckets, older games going in the last one
+    :return: integer key, or None for a game that doesn't fit the known categories
+    """
+    if game.code is None or game.role not in ROLE_INDEX:
+        return None
+    return (ROLE_INDEX[game.role] * CODES + game.code) * ages + min(game.age, ages - 1)
+
+
+def split_count_key(key, ages=AGE_BUCKETS):
+    """
+    :param key: count key
+    :param ages: number of age buckets
+    :return: tuple of (role, code, age)
+    """
+    rest, age = divmod(key, ages)
+    role, code = divmod(rest, CODES)
+    return roles[role], code, age
+
+
+def intern_event(event):
+    """
+    Returns the shared copy of an event name, so the games from the same event (across all officials) share one string
+    :param event: event name (or None)
+    :return: the shared event name
+    """
+    if event is None:
+        return None
+    return _events.setdefault(event, event)
+
+
+class Game(object):
     """
     Each official will have a history made up of many games
     Note:
-        Age is the the number of whole years since the reference date (freezeDate)
+        Age is the the number of whole years since the reference date (freezeDate), or None until one is applied
         Primacy is 1 for games worked in the primary position, 2 for secondary positions
+    Games are kept compact, as there are a lot of them: there's no per-game attribute dict (__slots__), and the
+    association, type, role and event are shared strings rather than a fresh copy for every game
+    Code is worked out from the association, type, primacy and role, for compiled WeightModels to look the game up by
     """
+    __slots__ = ('assn', 'type', 'role', 'age', 'date', 'primacy', 'event', 'code')
+
     def __init__(self, assn, type, role, age, primacy, date, event):
         # default "error" values
         self.assn = None
@@ -173,22 +429,166 @@ class Game:
         self.date = None
         self.primacy = None
         self.event = None
+        self.code = None
 
         # if all the inputs are valid, then populate the data
-        if (assn in assns) and (type in types) and (role in roles) and (age >= 0) and (primacy >= 1):
-            self.assn = assn
-            self.type = type
-            self.role = role
+        if (assn in assns) and (type in types) and (role in roles) and (age is None or age >= 0) and (primacy >= 1):
+            self.assn = _categories[assn]
+            self.type = _categories[type]
+            self.role = _categories[role]
             self.age = age
             self.date = date
             self.primacy = primacy
-            self.event = event
+            self.event = intern_event(event)
+            self.code = game_code(assn, type, primacy, role)
 
     def __repr__(self):
         return "<Assn %s, Role %s>" % (self.assn, self.role)
 
+    def __getstate__(self):
+        return (self.assn, self.type, self.role, self.age, self.date, self.primacy, self.event)
+
+    def __setstate__(self, state):
+        # share the strings again after being unpickled (from the cache, or from a worker process)
+        (assn, type, role, self.age, self.date, self.primacy, event) = state
+        self.assn = _categories.get(assn, assn)
+        self.type = _categories.get(type, type)
+        self.role = _categories.get(role, role)
+        self.event = intern_event(event)
+        self.code = game_code(self.assn, self.type, self.primacy, self.role)
+
+
+def combine_roles(weighting, qualified):
+    """
+    Finishes off the per role weighting and qualified games for one model (the weights already rounded to 2 places):
+    merging H into CH, and adding up each NSO family
+    :param weighting: dict of role: weighted value, updated in place
+    :param qualified: dict of role: qualified games, updated in place
+    :return: None
+    """
+    # CH and H count as the same role, but H doesn't get a CH bonus, so they should be added to the CH slot
+    weighting['CHR'] += weighting['HR']
+    qualified['CHR'] += qualified['HR']
+    weighting['CHNSO'] += weighting['HNSO']
+    qualified['CHNSO'] += qualified['HNSO']
+
+    # add in the weighting for each NSO family
+    for f in config.nso_family:
+        add_family(weighting, qualified, f)
+
+
+def add_family(weighting, qualified, family):
+    """
+    Adds up the weighting and qualified games for an NSO family (after H has been merged into CH)
+    :param weighting: dict of role: weighted value, updated in place
+    :param qualified: dict of role: qualified games, updated in place
+    :param family: name of the NSO family
+    :return: None
+    """
+    weighting[family] = 0
+    qualified[family] = 0
+    for r in config.nso_family[family]:
+        weighting[family] += weighting[r]
+        qualified[family] += qualified[r]
+    weighting[family] = round(weighting[family], 2)
+
+
+def game_age(date, freezeDate):
+    """
+    Calculates the age of a game, in whole years, relative to the freeze date
+    :param date: date of the game
+    :param freezeDate: the date to measure the age of games
+    :return: integer number of years
+    """
+    return relativedelta.relativedelta(freezeDate, date).years
+
+
+class _ModelDict(dict):
+    """A dict inside a WeightModel (the wgt table, and each association in it) that tells the model when it's changed,
+    so the model's compiled table is thrown away. Dicts put inside it are converted too
+    """
+    def __init__(self, model, *args, **kwargs):
+        dict.__init__(self)
+        self._model = model
+        self.update(*args, **kwargs)
+
+    def _wrap(self, value):
+        if isinstance(value, dict) and not isinstance(value, _ModelDict):
+            return _ModelDict(self._model, value)
+        return value
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, self._wrap(value))
+        self._model._invalidate()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._model._invalidate()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, value=None):
+        if key not in self:
+            self[key] = value
+        return self[key]
+
+    def pop(self, *args):
+        self._model._invalidate()
+        return dict.pop(self, *args)
 
-class WeightModel:
+    def popitem(self):
+        self._model._invalidate()
+        return dict.popitem(self)
+
+    def clear(self):
+        dict.clear(self)
+        self._model._invalidate()
+
+    def __reduce__(self):
+        # pickled (and copied) as a plain dict, as the model it belongs to isn't there yet when it's loaded
+        return dict, (_plain(self),)
+
+
+class _ModelList(list):
+    """A list inside a WeightModel (the age decay) that tells the model when it's changed
+    """
+    def __init__(self, model, values=()):
+        list.__init__(self, values)
+        self._model = model
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def _invalidating(name):
+    method = getattr(list, name)
+
+    def change(self, *args):
+        result = method(self, *args)
+        self._model._invalidate()
+        return result
+    change.__name__ = name
+    return change
+
+for _name in ['__setitem__', '__delitem__', '__setslice__', '__delslice__', '__iadd__', '__imul__', 'append', 'extend',
+              'insert', 'pop', 'remove', 'reverse', 'sort']:
+    setattr(_ModelList, _name, _invalidating(_name))
+
+
+def _plain(value):
+    """
+    Copies a model's factor (a dict or list, and any dicts inside it) as plain dicts and lists
+    """
+    if isinstance(value, dict):
+        return dict((k, _plain(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    return value
+
+
+class WeightModel(object):
     """This is a weighting model to weight each Game in an Official's history.
     The model describes weight factors that will be applied to each game.
     Each model will have a unique name what will be attached to the Official object so that multiple weighting models can
@@ -199,7 +599,12 @@ class WeightModel:
         - Primary or Secondary role (optional scale down factor for secondary roles)
         - Age of game (relative to today or otherwise configured freezeDate
         - Crew Head role bonus
+    The factors are compiled into a flat table of weights (and qualified flags) indexed by the Game's code and age, so
+    weighting a game is a single lookup. Changing any of the factors throws the table away, and it's rebuilt on next use
     """
+    # the factors that the compiled table is built from
+    factors = ('wgt', 'decay', 'ch_uplift', 'secondary_weight', 'tertiary_weight')
+
     def __init__(self, name, ch_uplift=1.2):
         self.wgt = {}
         self.name = name
@@ -216,67 +621,187 @@ class WeightModel:
     def __repr__(self):
         return "<Weight model %s>" % self.name
 
+    def __setattr__(self, name, value):
+        # keep an eye on the factors, so the compiled table can be thrown away when they change
+        if name == 'wgt':
+            value = _ModelDict(self, value)
+        elif name == 'decay':
+            value = _ModelList(self, value)
+        object.__setattr__(self, name, value)
+        if name in self.factors:
+            self._invalidate()
+
+    def __getstate__(self):
+        # the factors are kept as plain dicts and lists (and the compiled table is left out, it's rebuilt on next use)
+        state = dict((k, v) for k, v in self.__dict__.items() if k not in ('_ages', '_weights', '_qualifies'))
+        state['wgt'] = _plain(self.wgt)
+        state['decay'] = _plain(self.decay)
+        return state
+
+    def __setstate__(self, state):
+        # setting them again gives the loaded model (or a copy) its own containers, which tell it when they change
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _invalidate(self):
+        self.__dict__['_weights'] = None
+        self.__dict__['_qualifies'] = None
+
+    def compile(self):
+        """
+        Builds the flat tables of weights and qualified flags, one entry for each Game code (association, type, primacy,
+        crew head or not) and age (up to the length of the age decay, as older games all use the last decay factor)
+        :return: None
+        """
+        ages = len(self.decay)
+        weights = []
+        qualifies = []
+        for assn in assns:
+            for type in types:
+                for primacy in range(1, PRIMACIES + 1):
+                    for ch in (False, True):
+                        for age in range(ages):
+                            weights.append(self._weigh(assn, type, primacy, age, ch))
+                            qualifies.append(self._qualify(assn, type, primacy, age))
+        self.__dict__['_ages'] = ages
+        self.__dict__['_weights'] = weights
+        self.__dict__['_qualifies'] = qualifies
+
+    def tables(self, ages=AGE_BUCKETS):
+        """
+        Gets the compiled weights and qualified flags laid out like the count keys (without the role): [code][age]
+        :param ages: number of age buckets, which has to be enough to cover the age decay
+        :return: tuple of lists (weights, qualified)
+        """
+        if ages < len(self.decay):
+            raise ValueError(u'{} age buckets are too few for model {} (decay over {} years)'.format(ages, self.name,
+                                                                                                     len(self.decay)))
+        if self.__dict__.get('_weights') is None:
+            self.compile()
+        index = [code * self._ages + min(age, self._ages - 1) for code in range(CODES) for age in range(ages)]
+        return [self._weights[i] for i in index], [self._qualifies[i] for i in index]
+
+    def _lookup(self, game):
+        """
+        Finds where a game's values are in the compiled tables (compiling them if they've been thrown away)
+        :param game: Game object
+        :return: index into the tables, or None for a game that isn't covered by them
+        """
+        if game.code is None:
+            return None
+        return self._index(game.code, game.age)
+
+    def _index(self, code, age):
+        """
+        Finds where the values for a game code and age are in the compiled tables (compiling them if they've been
+        thrown away)
+        :return: index into the tables
+        """
+        if self.__dict__.get('_weights') is None:
+            self.compile()
+        ages = self._ages
+        if age < ages:
+            return code * ages + age
+        else:
+            return code * ages + ages - 1
+
     def weight(self, game):
         """
         Takes a Game and produces a weighted value for that game, based on the weighting model
         :param game: Game object
         :return: real number value
         """
-        if game.assn not in self.wgt.keys():
+        i = self._lookup(game)
+        if i is None:
+            return self._weigh(game.assn, game.type, game.primacy, game.age, game.role in CH_ROLES)
+        return self._weights[i]
+
+    def qualify(self, game):
+        """
+        Takes a Game and produces a qualified value for that game, based on the weighting model
+        as to whether the game should be included in the minimums or not.
+        :param game: Game object
+        :return: integer number value (1 or 0)
+        """
+        i = self._lookup(game)
+        if i is None:
+            return self._qualify(game.assn, game.type, game.primacy, game.age)
+        return self._qualifies[i]
+
+    def weight_code(self, code, age):
+        """
+        Weighted value for any game with the code and age (see Game)
+        :return: real number value
+        """
+        i = self._index(code, age)
+        return self._weights[i]
+
+    def qualify_code(self, code, age):
+        """
+        Qualified value for any game with the code and age (see Game)
+        :return: integer number value (1 or 0)
+        """
+        i = self._index(code, age)
+        return self._qualifies[i]
+
+    def _weigh(self, assn, type, primacy, age, ch):
+        """
+        Works out the weighted value for a game, based on the weighting model (this is what the compiled table holds)
+        :return: real number value
+        """
+        if assn not in self.wgt.keys():
             return 0
-        if game.type not in self.wgt[game.assn].keys():
+        if type not in self.wgt[assn].keys():
             return 0
 
         # apply the basic weighing of the game and association from the model
-        wgt = self.wgt[game.assn][game.type]
+        wgt = self.wgt[assn][type]
 
         # apply the scaling for secondary roles
-        if game.primacy == 2:
+        if primacy == 2:
             wgt = wgt * self.secondary_weight
 
         # apply the scaling for tertiary roles (ie Other tab games)
-        if game.primacy == 3:
+        if primacy == 3:
             wgt = wgt * self.tertiary_weight
 
         # apply the age decay
-        if game.age < len(self.decay):
-            wgt = wgt * self.decay[game.age]
+        if age < len(self.decay):
+            wgt = wgt * self.decay[age]
         else:
             wgt = wgt * self.decay[-1]
 
         # apply the CH uplift
-        if game.role in ['CHR', 'CHNSO']:
+        if ch:
             wgt = wgt * self.ch_uplift
 
         return wgt
 
-    def qualify(self, game):
+    def _qualify(self, assn, type, primacy, age):
         """
-        Takes a Game and produces a qualified value for that game, based on the weighting model
-        as to whether the game should be included in the minimums or not.
+        Works out whether a game should be included in the minimums or not (this is what the compiled table holds)
         Based on the assumption that if there is a weighting entry for the association/type/age that is greater than 0,
         then the game counts as a qualified game
         Also, that if games have a primacy other than 1, the game des not qualify
-        :param game: Game object
         :return: integer number value (1 or 0)
         """
-        if game.assn not in self.wgt.keys():
+        if assn not in self.wgt.keys():
             return 0
-        if game.type not in self.wgt[game.assn].keys():
+        if type not in self.wgt[assn].keys():
             return 0
 
-        if game.primacy > 1:
+        if primacy > 1:
             return 0
 
         # figure out the age decay
-        if game.age < len(self.decay):
-            decay = self.decay[game.age]
+        if age < len(self.decay):
+            decay = self.decay[age]
         else:
             decay = self.decay[-1]
         if decay <= 0:
             return 0
 
-        if self.wgt[game.assn][game.type] > 0:
+        if self.wgt[assn][type] > 0:
             return 1
         else:
             return 0
@@ -384,13 +909,108 @@ def create_weights():
     return w
 
 
-def sort_by_role(officials, role, weight_model, filter=True):
+def weigh_officials(officials, models):
+    """
+    Applies the weight models to each official in a stream of officials (such as from iter_files_from_dir), handing
+    each one on as soon as it's been weighted
+    :param officials: iterable of Officials
+    :param models: list of WeightModels to be applied
+    :return: generator of Officials
+    """
+    for off in officials:
+        off.apply_weight_models(models)
+        yield off
+
+
+def weighting_series(official, models, freezeDates):
+    """
+    Works out an official's weighting and qualified games at each of a list of freeze dates, in one go rather than
+    applying each freeze date in turn
+    A game's age only changes on its anniversaries, so each game adds to the count for its role, code and age from the
+    freeze date on or after each anniversary, up to the next one. The counts at each freeze date are then added up from
+    those changes, and weighed once per count key
+    :param official: Official object (not compacted, as it needs the whole history)
+    :param models: list of WeightModels
+    :param freezeDates: sorted list of freeze dates
+    :return: tuple of dicts (weighting, qualified games), each of model name: role (or NSO family): list of values,
+        one for each freeze date (the same values as Official.weighting and qualified_games at that freeze date,
+        apart from a total that lands right on a rounding boundary, which can round the other way)
+    """
+    if official.history is None:
+        raise ValueError(u'{} has been compacted without keeping the games'.format(official.name))
+    for model in models:
+        if len(model.decay) > AGE_BUCKETS:
+            raise ValueError(u'Model {} decays over more years than are counted ({})'.format(model.name, AGE_BUCKETS))
+    dates = len(freezeDates)
+
+    # the change in each count at each freeze date, with games that can't be counted weighed on their own
+    changes = {}
+    others = []
+    for game in official.history:
+        if game.role not in ROLE_INDEX:
+            continue
+        start = bisect_left(freezeDates, game.date)
+        for age in range(AGE_BUCKETS):
+            if start >= dates:
+                break
+            if age == AGE_BUCKETS - 1:
+                end = dates
+            else:
+                end = bisect_left(freezeDates, game.date + relativedelta.relativedelta(years=age + 1))
+            if end > start:
+                if game.code is None:
+                    others.append((game, age, start, end))
+                else:
+                    key = (ROLE_INDEX[game.role] * CODES + game.code) * AGE_BUCKETS + age
+                    change = changes.setdefault(key, [0] * (dates + 1))
+                    change[start] += 1
+                    change[end] -= 1
+            start = end
+
+    totals = [(model, [dict((r, 0) for r in roles) for d in freezeDates],
+               [dict((r, 0) for r in roles) for d in freezeDates]) for model in models]
+    for key in sorted(changes):
+        role, code, age = split_count_key(key)
+        n = 0
+        for d, change in enumerate(changes[key][:dates]):
+            n += change
+            if n:
+                for model, weights, qualified in totals:
+                    weights[d][role] += n * model.weight_code(code, age)
+                    qualified[d][role] += n * model.qualify_code(code, age)
+    for game, age, start, end in others:
+        for model, weights, qualified in totals:
+            wgt = model._weigh(game.assn, game.type, game.primacy, age, game.role in CH_ROLES)
+            qual = model._qualify(game.assn, game.type, game.primacy, age)
+            for d in range(start, end):
+                weights[d][game.role] += wgt
+                qualified[d][game.role] += qual
+
+    weighting = {}
+    qualified_games = {}
+    for model, weights, qualified in totals:
+        series = dict((r, []) for r in roles + config.nso_family.keys())
+        qualified_series = dict((r, []) for r in roles + config.nso_family.keys())
+        for d in range(dates):
+            w = dict((r, round(weights[d][r], 2)) for r in roles)
+            q = dict(qualified[d])
+            combine_roles(w, q)
+            for r in w:
+                series[r].append(w[r])
+                qualified_series[r].append(q[r])
+        weighting[model.name] = series
+        qualified_games[model.name] = qualified_series
+    return weighting, qualified_games
+
+
+def sort_by_role(officials, role, weight_model, filter=True, top_k=None):
     """
     This function sorts the officials in a list, in order of their weighted value for a role, in a given model
     :param officials: list of officials
     :param role: role to be sorted by
     :param weight_model: name of the model to sort by
     :param filter: if the zero weight entries should be removed from the returned list
+    :param top_k: only return the first top_k officials (picked out with a heap, rather than sorting everyone)
     :return: sorted list of officials data (name, cert level (ref or NSO depending on the role), weighted value, raw games in that role)
     """
 
@@ -399,14 +1019,75 @@ def sort_by_role(officials, role, weight_model, filter=True):
     if filter is True:
         list = ifilter(lambda x: methodcaller('get_weight', role, weight_model)(x) > 0, officials)
 
-    # sort the list by weighted value
-    list = sorted(list, key=methodcaller('get_weight', role, weight_model), reverse=True)
+    # sort the list by weighted value (ties stay in the order they came in, either way)
+    if top_k is None:
+        list = sorted(list, key=methodcaller('get_weight', role, weight_model), reverse=True)
+    else:
+        list = heapq.nlargest(top_k, list, key=methodcaller('get_weight', role, weight_model))
 
     # return a list of tuples containing just the information needed
     #return map(lambda z: (z.name, z.refcert if role in config.ref_roles else z.nsocert, z.weighting[weight_model][role], len(z.get_games(role))), list)
     return map(lambda z: z.get_role_summary(role, weight_model), list)
 
 
+class Leaderboard:
+    """The officials ranked in each role for one weight model, in the same order as sort_by_role gives (leaving out
+    officials with no weight in the role).
+    The given roles are each sorted once, when the leaderboard is built, and kept, so the top officials in a role and
+    the rank of any official can be looked up as often as needed without sorting the pool again. Any other role (like
+    an NSO family) is sorted the first time it's asked for
+    """
+
+    def __init__(self, officials, weight_model, roles=config.ref_roles + config.nso_roles):
+        self.officials = list(officials)
+        self.model = weight_model
+        self.roles = roles
+        self.ranked = {}
+        self.ranks = {}
+        for role in roles:
+            self._rank_role(role)
+
+    def __repr__(self):
+        return "<Leaderboard %s, officials %d>" % (self.model, len(self.officials))
+
+    def _rank_role(self, role):
+        model = self.model
+        ranked = [o for o in self.officials if o.weighting[model][role] > 0]
+        ranked.sort(key=lambda o: o.weighting[model][role], reverse=True)
+        self.ranked[role] = ranked
+        self.ranks[role] = dict((o, i + 1) for i, o in enumerate(ranked))
+
+    def top(self, role, k=None):
+        """
+        :param role: role to be ranked by
+        :param k: number of officials wanted (None for all of them)
+        :return: list of Officials, highest weighted first
+        """
+        if role not in self.ranked:
+            self._rank_role(role)
+        if k is None:
+            return list(self.ranked[role])
+        return self.ranked[role][:k]
+
+    def rank(self, role, official):
+        """
+        :param role: role to be ranked by
+        :param official: Official from the pool
+        :return: the official's rank in the role (1 is the highest), or None if they have no weight in it
+        """
+        if role not in self.ranked:
+            self._rank_role(role)
+        return self.ranks[role].get(official)
+
+    def summaries(self, role, k=None):
+        """
+        :param role: role to be ranked by
+        :param k: number of officials wanted (None for all of them)
+        :return: the officials' role summaries, highest weighted first (like sort_by_role)
+        """
+        return [o.get_role_summary(role, self.model) for o in self.top(role, k)]
+
+
 if __name__ == '__main__':
     #o = filtertest()
     w = create_weights()
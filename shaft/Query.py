@@ -0,0 +1,136 @@
+"""
+Querying a loaded pool of officials (the sort of filtering in filtertest, done interactively)
+Every field that's queried gets a sorted index the first time it's used, so each condition is found with a binary
+search rather than checking every official, for example the NSOs with cert 2 or more and at least 5 qualified JT games
+under a model, highest weighted first:
+    pool = shaft.Pool(o)
+    pool.query([('nsocert', '>=', 2), (('qualified_games', 'wstrict', 'JT'), '>=', 5)],
+               order_by=('weighting', 'wstrict', 'JT'))
+"""
+__author__ = 'hammer'
+
+import heapq
+from bisect import bisect_left, bisect_right
+
+OPERATORS = ['>=', '>', '<=', '<', '==']
+
+
+def field_value(official, field):
+    """
+    Gets the value of a field for an official
+    :param official: Official object
+    :param field: an attribute name (like 'refcert', 'nsocert', 'game_tally' or 'name'), or a tuple of
+        ('weighting' or 'qualified_games', model name, role)
+    :return: the value
+    """
+    if isinstance(field, tuple):
+        attribute, model, role = field
+        return getattr(official, attribute)[model][role]
+    return getattr(official, field)
+
+
+def _bounds(keys, op, value):
+    """
+    Finds the part of a sorted list of keys that matches a condition
+    :return: tuple of (start, end) indexes
+    """
+    if op == '>=':
+        return bisect_left(keys, value), len(keys)
+    elif op == '>':
+        return bisect_right(keys, value), len(keys)
+    elif op == '<=':
+        return 0, bisect_right(keys, value)
+    elif op == '<':
+        return 0, bisect_left(keys, value)
+    elif op == '==':
+        return bisect_left(keys, value), bisect_right(keys, value)
+    raise ValueError(u'Unknown operator {} (should be one of {})'.format(op, ', '.join(OPERATORS)))
+
+
+def _test(x, op, value):
+    if op == '>=':
+        return x >= value
+    elif op == '>':
+        return x > value
+    elif op == '<=':
+        return x <= value
+    elif op == '<':
+        return x < value
+    return x == value
+
+
+class Pool:
+    """A pool of loaded officials, with a sorted index for each field that's been queried.
+    The indexes are built from the officials as they are when first used, so call refresh after applying weight
+    models (or otherwise changing the officials)
+    """
+
+    def __init__(self, officials):
+        self.officials = list(officials)
+        self.indexes = {}
+
+    def __repr__(self):
+        return "<Pool officials %d, indexes %d>" % (len(self.officials), len(self.indexes))
+
+    def refresh(self):
+        """
+        Throws away the indexes, so they're rebuilt from the officials as they are now
+        :return: None
+        """
+        self.indexes = {}
+
+    def index(self, field):
+        """
+        Gets the index for a field, building it if needed
+        :param field: field name or tuple (see field_value)
+        :return: tuple of lists (sorted values, position of the official in the pool for each value)
+        """
+        if field not in self.indexes:
+            values = sorted((field_value(o, field), i) for i, o in enumerate(self.officials))
+            self.indexes[field] = ([v for v, i in values], [i for v, i in values])
+        return self.indexes[field]
+
+    def count(self, field, op, value):
+        """
+        :return: number of officials matching a single condition
+        """
+        keys, positions = self.index(field)
+        start, end = _bounds(keys, op, value)
+        return max(0, end - start)
+
+    def query(self, conditions=(), order_by=None, reverse=True, limit=None):
+        """
+        Finds the officials matching all the conditions
+        The condition matching the fewest officials is looked up in its index, and only those officials are checked
+        against the rest of the conditions
+        :param conditions: list of tuples (field, operator, value), operator being one of '>=', '>', '<=', '<', '=='
+        :param order_by: field to order the officials by (None leaves them in pool order)
+        :param reverse: order highest first
+        :param limit: only return this many officials
+        :return: list of Officials (officials with the same value stay in pool order)
+        """
+        matches = []
+        for field, op, value in conditions:
+            keys, positions = self.index(field)
+            start, end = _bounds(keys, op, value)
+            matches.append((max(0, end - start), field, op, value, positions[start:end]))
+        matches.sort(key=lambda m: m[0])
+
+        if matches:
+            candidates = sorted(matches[0][4])
+            for size, field, op, value, positions in matches[1:]:
+                candidates = [i for i in candidates if _test(field_value(self.officials[i], field), op, value)]
+        else:
+            candidates = range(len(self.officials))
+        found = [self.officials[i] for i in candidates]
+
+        if order_by is not None:
+            key = lambda o: field_value(o, order_by)
+            if limit is not None and reverse:
+                return heapq.nlargest(limit, found, key=key)
+            if limit is not None:
+                return heapq.nsmallest(limit, found, key=key)
+            found.sort(key=key, reverse=reverse)
+        if limit is not None:
+            return found[:limit]
+        return found
@@ -1,12 +1,16 @@
 """
-Taking a list of Officials and saving the summary to an Excel sheet
+Taking a list of Officials and saving the summary to an Excel sheet (or CSV, TSV or JSON lines files, see Writers.py)
+The workbooks are written in openpyxl's write-only mode, so each row goes out as it's added rather than every cell
+being kept in memory until the workbook is saved (which means each tab is written top to bottom, in tab order)
+openpyxl only streams the rows out with lxml installed; without it the write-only rows are still held in memory
 """
 __author__ = 'hammer'
 
 from shaft import Official
 from shaft import Game
 from shaft import __version__
-from Offical import sort_by_role
+from Offical import Leaderboard
+from Writers import open_writer
 
 import re
 import os
@@ -15,7 +19,6 @@ from operator import attrgetter
 from dateutil import relativedelta
 from openpyxl import load_workbook
 from openpyxl import utils
-from openpyxl import Workbook
 
 import config
 assns = config.assns
@@ -26,131 +29,122 @@ nso_roles = config.nso_roles
 nso_family = config.nso_family
 
 
-def create_results(file_name, officials, model):
+def create_results(file_name, officials, model, format='xlsx'):
     """
     create the Excel file summarizing the officials, given the chosen weighting model
     :param file_name: the name of the file to output
-    :param officials: the list of officials
+    :param officials: the list of officials (which can be empty, giving just the headers)
     :param model: the weighting model to use
+    :param format: 'xlsx', or 'csv', 'tsv' or 'jsonl' for a file per tab
     :return: the excel object (for now)
     """
-    # TODO: add in autofilters
-    order = 0
-    wb = Workbook()
-    page1 = wb.active
-    page1.title = "Applicants"
+    # the headers are the same for every official, so a blank one will do for an empty list
+    first = officials[0] if officials else Official(u'')
 
-    header = officials[0].get_summary_header()
-    wb['Applicants'].append(header)
+    # TODO: add in autofilters
+    wb = open_writer(file_name, format)
+    applicants = wb.sheet('Applicants', first.get_summary_header())
     #wb['applicants'].auto_filter.ref = 'A1:BH1'
 
     # print summary of entire list, sorted by name
     for off in sorted(officials, key=attrgetter('name')):
         print off
-        off.get_summary(model.name)
-        wb['Applicants'].append(off.get_summary(model.name))
+        applicants.append(off.get_summary(model.name))
 
     # go through each ref role:
+    board = Leaderboard(officials, model.name)
     for r in ref_roles:
-        order += 1
-        wb.create_sheet(order, r)
-        wb[r].append(officials[0].get_role_header())
-        for o in sort_by_role(officials, r, model.name):
-            wb[r].append(o)
+        ws = wb.sheet(r, first.get_role_header())
+        for o in board.summaries(r):
+            ws.append(o)
 
     # go through each nso role:
     for r in nso_roles:
-        order += 1
-        wb.create_sheet(order, r)
-        wb[r].append(officials[0].get_role_header())
-        for o in sort_by_role(officials, r, model.name):
-            wb[r].append(o)
+        ws = wb.sheet(r, first.get_role_header())
+        for o in board.summaries(r):
+            ws.append(o)
 
     # write out the weighting table used as the last tab, for comparison purposes and some metadata
-    order += 1
-    wb.create_sheet(order, 'model')
-    wb['model'].append(['Weighting Model: ','','(generated by SHAFT ' + str(__version__) + ')'])
-    wb['model'].append(['Model Name: ', model.name])
-    wb['model'].append(['CH Uplift:', 'This is applied to boost the value of CH over H positions, as being more desirable for tournaments'])
-    wb['model'].append([model.ch_uplift])
-    wb['model'].append(['Secondary Role Factor:', 'This applied to positions in the "Secondary Position" column'])
-    wb['model'].append([model.secondary_weight])
+    ws = wb.sheet('model')
+    ws.append(['Weighting Model: ','','(generated by SHAFT ' + str(__version__) + ')'])
+    ws.append(['Model Name: ', model.name])
+    ws.append(['CH Uplift:', 'This is applied to boost the value of CH over H positions, as being more desirable for tournaments'])
+    ws.append([model.ch_uplift])
+    ws.append(['Secondary Role Factor:', 'This applied to positions in the "Secondary Position" column'])
+    ws.append([model.secondary_weight])
     #wb['model'].append(['Tertiary Role Factor:', model.tertiary_weight])
     #wb['model'].append(['This is for games in the "Other" tab (currently unused)'])
-    wb['model'].append(['Age Decay Factor:', 'Each number represents the weighting applied to a game, depending how many years old the game is'])
-    wb['model'].append(['Age:'] + range(len(model.decay)) + ['+'])
-    wb['model'].append(['Factor:'] + model.decay + [model.decay[-1]])
+    ws.append(['Age Decay Factor:', 'Each number represents the weighting applied to a game, depending how many years old the game is'])
+    ws.append(['Age:'] + range(len(model.decay)) + ['+'])
+    ws.append(['Factor:'] + model.decay + [model.decay[-1]])
 
     # print out each association in the model
     for assn in sorted(model.wgt, reverse=True):
-        wb['model'].append(['Association: ', assn])
+        ws.append(['Association: ', assn])
 
         # print out each game type in the assocation model
         # TODO: OPTIONAL: figure out how to from highest weight to lowest, because this doesn't work:
         # for t in sorted(model.wgt[assn], key=lambda val: val[1], reverse=True):
         for t in model.wgt[assn]:
-            wb['model'].append(['Type: ', t, model.wgt[assn][t]])
+            ws.append(['Type: ', t, model.wgt[assn][t]])
 
     # save the file
-    wb.save(file_name)
+    wb.close()
 
 
-def create_rejects(file_name, rejects):
+def create_rejects(file_name, rejects, format='xlsx'):
     '''
     Creates a file with the rejected file names, and the reason for rejection
     :param file_name: filename to write to
     :param rejects: list of tuples (history file, reject reason)
+    :param format: 'xlsx', 'csv', 'tsv' or 'jsonl'
     :return: None
     '''
 
     # TODO: set up the file so it reads in existing file, and write out the new file, including manually caught errors (like permissions or something)
 
     # set up the rejects file
-    wb = Workbook()
-    page1 = wb.active
-    page1.title = "Unprocessed Applicants"
-    wb['Unprocessed Applicants'].append(['History Document', 'Error'])
+    wb = open_writer(file_name, format)
+    page1 = wb.sheet("Unprocessed Applicants", ['History Document', 'Error'])
 
     for r in rejects:
-        wb['Unprocessed Applicants'].append(r)
+        page1.append(r)
 
     # save the file
-    wb.save(file_name)
+    wb.close()
 
 
-def create_events(file_name, events):
+def create_events(file_name, events, format='xlsx'):
     """
     Creates a file with the events file names, and the list of unique events
     :param file_name: filename to write to
     :param events: list of tuples (name, year, event name, type of event, role)
+    :param format: 'xlsx', 'csv', 'tsv' or 'jsonl'
     :return: None
     """
 
     # set up the events file
-    wb = Workbook()
-    page1 = wb.active
-    page1.title = 'Events'
-    wb['Events'].append(['Name', 'Event Year', 'Event name', 'Type of event', 'Role'])
+    wb = open_writer(file_name, format)
+    page1 = wb.sheet('Events', ['Name', 'Event Year', 'Event name', 'Type of event', 'Role'])
 
     for e in events:
-        wb['Events'].append(e)
+        page1.append(e)
 
     # save the file
-    wb.save(file_name)
+    wb.close()
 
 
-def create_raw_results(file_name, officials, model):
+def create_raw_results(file_name, officials, model, sort=True, format='xlsx'):
     """
     create the Excel file giving a raw dump of the officials, given the chosen weighting model
     :param file_name: the name of the file to output
-    :param officials: the list of officials
+    :param officials: the list of officials (or any iterable of them, such as a stream from iter_files_from_dir)
     :param model: the weighting model to use
+    :param sort: if the officials should be sorted by name (False writes them in the order they arrive)
+    :param format: 'xlsx', or 'csv', 'tsv' or 'jsonl' for a file per tab (much faster for big dumps)
     :return: the excel object (for now)
     """
-    order = 0
-    wb = Workbook()
-    page1 = wb.active
-    page1.title = "Applicants (RAW)"
+    wb = open_writer(file_name, format)
 
     # header row for all the game data, smooshed with the core official data
     header = []
@@ -159,9 +153,8 @@ def create_raw_results(file_name, officials, model):
     header.append('ref_tally')
     header.append('nsocert')
     header.append('nso_tally')
-    wb['Applicants (RAW)'].append(header)
+    page1 = wb.sheet("Applicants (RAW)", header)
 
-    wb.create_sheet(1,'Games (RAW)')
     header = []
     header.append('name')
     header.append('assn')
@@ -172,10 +165,12 @@ def create_raw_results(file_name, officials, model):
     header.append('value')
     header.append('event')
     header.append('primacy')
-    wb['Games (RAW)'].append(header)
+    page2 = wb.sheet('Games (RAW)', header)
 
     # print summary of entire list, sorted by name
-    for off in sorted(officials, key=attrgetter('name')):
+    if sort:
+        officials = sorted(officials, key=attrgetter('name'))
+    for off in officials:
         # print the official info in the applicants tab
         print off
         official_denormalized = []
@@ -184,7 +179,7 @@ def create_raw_results(file_name, officials, model):
         official_denormalized.append(off.ref_tally)
         official_denormalized.append(off.nsocert)
         official_denormalized.append(off.nso_tally)
-        wb['Applicants (RAW)'].append(official_denormalized)
+        page1.append(official_denormalized)
 
         # print the game data in the games tab, official's name is the joining key
         for j in off.games:
@@ -200,7 +195,7 @@ def create_raw_results(file_name, officials, model):
             game_denormalized.append('')
             game_denormalized.append(j.primacy)
             #print "name = %s, role = %s, on %s" % (game_denormalized[0], game_denormalized[5], game_denormalized[3])
-            wb['Games (RAW)'].append(game_denormalized)
+            page2.append(game_denormalized)
 
     # save the file
-    wb.save(file_name)
+    wb.close()
@@ -0,0 +1,210 @@
+"""
+Reading live history docs through the Google Sheets API (v4)
+Each history doc costs two requests: one for the list of tabs, and one batched fetch of every range the history
+parser uses (Summary, Instructions, Game History and Other History)
+"""
+__author__ = 'hammer'
+
+import re
+import json
+import time
+import random
+import urllib
+import urllib2
+
+from openpyxl.utils.datetime import from_excel
+
+import config
+from Xlsx import split_ref
+
+SHEETS_API = 'https://sheets.googleapis.com/v4/spreadsheets'
+
+# responses that are worth trying again (rate limiting and server side trouble)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+SHEET_ID = re.compile(r'/spreadsheets/d/([a-zA-Z0-9_-]+)')
+
+
+class SheetsError(Exception):
+    """An error response from the Sheets API (after any retries)"""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, u'Sheets API error {}: {}'.format(status, message))
+        self.status = status
+
+
+def spreadsheet_id(url):
+    """
+    Pulls the spreadsheet ID out of a Google Sheets URL
+    :param url: the URL of the history doc (or just its ID)
+    :return: string ID
+    """
+    match = SHEET_ID.search(url)
+    if match:
+        return match.group(1)
+    return url.strip()
+
+
+def urllib_transport(method, url, headers, timeout=60):
+    """
+    The default transport, making the HTTP request with urllib2
+    A transport is any function with this signature, so the client can be pointed at something else (like a fake
+    Sheets API server for testing)
+    :param method: HTTP method
+    :param url: full URL, including the query string
+    :param headers: dict of request headers
+    :param timeout: seconds to wait for the response
+    :return: tuple of (HTTP status, response body)
+    """
+    request = urllib2.Request(url, headers=headers)
+    request.get_method = lambda: method
+    try:
+        response = urllib2.urlopen(request, timeout=timeout)
+    except urllib2.HTTPError as e:
+        return e.code, e.read()
+    return response.getcode(), response.read()
+
+
+class SheetsClient:
+    """A minimal client for the parts of the Sheets API that the history loader needs.
+    Authenticates with either an OAuth access token or an API key (for docs shared publicly), and retries rate
+    limited or failed requests with exponential backoff.
+    """
+
+    def __init__(self, token=None, api_key=None, transport=urllib_transport, base_url=SHEETS_API, retries=5,
+                 backoff=1.0, max_backoff=32.0):
+        self.token = token
+        self.api_key = api_key
+        self.transport = transport
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def __repr__(self):
+        return "<Sheets client %s>" % self.base_url
+
+    def get(self, path, params):
+        """
+        Makes a GET request to the API, retrying with backoff if it's rate limited or fails
+        :param path: path after the base URL
+        :param params: list of (name, value) query parameters
+        :return: the decoded JSON response
+        """
+        params = list(params)
+        headers = {'Accept': 'application/json'}
+        if self.token:
+            headers['Authorization'] = 'Bearer ' + self.token
+        if self.api_key:
+            params.append(('key', self.api_key))
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.urlencode([(k, v.encode('utf-8') if isinstance(v, unicode) else v) for k, v in params])
+
+        attempt = 0
+        while True:
+            try:
+                status, body = self.transport('GET', url, headers)
+            except IOError as e:
+                # network trouble is treated like a server error
+                status, body = None, str(e)
+            if status is not None and 200 <= status < 300:
+                return json.loads(body)
+            if (status is not None and status not in RETRY_STATUSES) or attempt >= self.retries:
+                raise SheetsError(status, body)
+            # exponential backoff, with some jitter so concurrent loads don't all retry at once
+            delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+            time.sleep(delay * random.uniform(0.5, 1.0))
+            attempt += 1
+
+    def sheet_names(self, sheet_id):
+        """
+        :param sheet_id: spreadsheet ID
+        :return: list of the names of the tabs in the spreadsheet
+        """
+        result = self.get('/' + urllib.quote(sheet_id), [('fields', 'sheets.properties.title')])
+        return [s['properties']['title'] for s in result.get('sheets', [])]
+
+    def batch_get(self, sheet_id, ranges):
+        """
+        Fetches several ranges of values in a single request
+        Values come back unformatted, so numbers are numbers and dates are serial numbers (like in an xlsx file)
+        :param sheet_id: spreadsheet ID
+        :param ranges: list of A1 ranges, such as "'Game History'!A4:J"
+        :return: list of lists of rows, one for each range
+        """
+        params = [('ranges', r) for r in ranges]
+        params += [('majorDimension', 'ROWS'), ('valueRenderOption', 'UNFORMATTED_VALUE'),
+                   ('dateTimeRenderOption', 'SERIAL_NUMBER')]
+        result = self.get('/' + urllib.quote(sheet_id) + '/values:batchGet', params)
+        return [r.get('values', []) for r in result.get('valueRanges', [])]
+
+
+class SheetValuesReader:
+    """Serves the values fetched from a live history doc through the same interface as the xlsx readers
+    (see shaft/Xlsx.py), so the same history parser can be used on it
+    """
+    # the ranges the history parser needs from each tab: (tab, first column, first row, last column, last row)
+    RANGES = [('Summary', 'A', 1, 'D', 8),
+              ('Instructions', 'A', 1, 'A', 104),
+              ('Game History', 'A', config.history_header_rows + 1, 'J', None),
+              ('Other History', 'A', config.history_header_rows + 1, 'J', None)]
+
+    def __init__(self, client, url):
+        self.url = url
+        self.sheet_id = spreadsheet_id(url)
+        self._sheets = client.sheet_names(self.sheet_id)
+        self._values = {}
+
+        # fetch all the ranges that exist in this doc in one go
+        wanted = [r for r in self.RANGES if r[0] in self._sheets]
+        ranges = []
+        for (sheet, first_col, first_row, last_col, last_row) in wanted:
+            ranges.append(u"'{}'!{}{}:{}{}".format(sheet.replace("'", "''"), first_col, first_row, last_col,
+                                                   last_row or ''))
+        for (sheet, first_col, first_row, last_col, last_row), rows in zip(wanted, client.batch_get(self.sheet_id,
+                                                                                                    ranges)):
+            self._values[sheet] = (first_row, rows)
+
+    def __repr__(self):
+        return "<Sheet values reader %s>" % self.sheet_id
+
+    def close(self):
+        pass
+
+    def sheet_names(self):
+        return self._sheets
+
+    def _value(self, sheet, col, row):
+        first_row, rows = self._values.get(sheet, (1, []))
+        if row < first_row or row - first_row >= len(rows):
+            return None
+        values = rows[row - first_row]
+        if col >= len(values) or values[col] == '':
+            return None
+        return values[col]
+
+    def cell(self, sheet, ref):
+        col, row = split_ref(ref)
+        return self._value(sheet, col, row)
+
+    def cells(self, sheet, refs):
+        return [self.cell(sheet, ref) for ref in refs]
+
+    def rows(self, sheet, min_row=1, max_col=config.history_columns):
+        """
+        Returns the rows of a history tab
+        The API doesn't say which cells are dates, so numbers in column A (the game date) are converted to datetimes
+        :param sheet: name of the tab
+        :param min_row: first row to return
+        :param max_col: number of columns to return, starting at A
+        :return: generator of tuples of max_col values
+        """
+        first_row, rows = self._values.get(sheet, (1, []))
+        blank = (None,) * max_col
+        for row in xrange(max(min_row, first_row), first_row + len(rows)):
+            values = tuple(v if v != '' else None for v in rows[row - first_row][:max_col])
+            values += blank[len(values):]
+            if isinstance(values[0], (int, long, float)) and not isinstance(values[0], bool):
+                values = (from_excel(values[0]),) + values[1:]
+            yield values
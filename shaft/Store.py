@@ -0,0 +1,330 @@
+"""
+Keeping officials and their games in a local SQLite database, so the history docs from every tournament build up in
+one place (the same people apply year after year) and a new tournament can be ranked from the store without reading
+the workbooks again:
+    store = shaft.HistoryStore('history.db')
+    rejects = store.ingest_dir('histories')
+    board = store.rankings(w[0], datetime.date(2018, 1, 1))
+Each history doc is keyed on the SHA-1 of its contents, so a doc that's already been ingested (under any file name) is
+skipped. Officials are keyed on their name, and a doc for the same official only replaces their games if it's at
+least as recent as the one stored (by the date of the latest game), whatever order the docs are ingested in
+The rankings are worked out in SQL: the model's weights go in a temporary table keyed on association, type, primacy,
+crew head or not and age, which each game is joined against (its age measured from the freeze date), then summed up
+per official and role
+"""
+__author__ = 'hammer'
+
+import sqlite3
+import hashlib
+import datetime
+
+import config
+from Offical import Official, Game, CH_ROLES, PRIMACIES, HEAD_ROLES, ROLE_FAMILIES
+from Load import load_history, list_history_files, UNSUPPORTED
+
+assns = config.assns
+types = config.types
+roles = config.roles
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS officials (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    refcert INTEGER,
+    nsocert INTEGER,
+    source TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    hash TEXT PRIMARY KEY,
+    file_name TEXT,
+    official INTEGER REFERENCES officials (id),
+    reason TEXT,
+    added TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    official INTEGER NOT NULL REFERENCES officials (id),
+    assn TEXT,
+    type TEXT,
+    role TEXT,
+    date TEXT,
+    primacy INTEGER,
+    event TEXT
+);
+CREATE INDEX IF NOT EXISTS games_official ON games (official);
+CREATE INDEX IF NOT EXISTS games_role ON games (role, date);
+CREATE INDEX IF NOT EXISTS games_assn_type ON games (assn, type);
+CREATE INDEX IF NOT EXISTS games_date ON games (date);
+CREATE TEMP TABLE weights (
+    assn TEXT,
+    type TEXT,
+    primacy INTEGER,
+    ch INTEGER,
+    age INTEGER,
+    weight REAL,
+    qualified INTEGER,
+    PRIMARY KEY (assn, type, primacy, ch, age)
+);
+CREATE TEMP TABLE slots (
+    role TEXT,
+    slot TEXT
+);
+CREATE TEMP TABLE role_weights (
+    official INTEGER,
+    role TEXT,
+    weight REAL,
+    qualified INTEGER
+);
+"""
+
+# whole years from the game to the freeze date (like game_age), capped at the last age in the weights table. A game on
+# Feb 29 has its anniversary on the last day of February, the same as relativedelta
+AGE = """MIN(CAST(strftime('%Y', :freeze) AS INTEGER) - CAST(strftime('%Y', g.date) AS INTEGER)
+             - (strftime('%m-%d', :freeze) < replace(strftime('%m-%d', g.date), '02-29',
+                                                     strftime('%m-%d', :freeze, 'start of year', '+2 months', '-1 day'))),
+             :ages - 1)"""
+
+# each official's weighting and qualified games in each role. The games are scanned official by official, in the order
+# they were added, so each total is added up in the same order as apply_weight_models does (and rounds the same way)
+ROLE_WEIGHTS = """
+INSERT INTO role_weights
+SELECT g.official, g.role, py_round(SUM(w.weight), 2), SUM(w.qualified)
+FROM games g INDEXED BY games_official JOIN weights w
+    ON w.assn = g.assn AND w.type = g.type AND w.primacy = g.primacy
+    AND w.ch = (g.role IN ({ch})) AND w.age = {age}
+WHERE g.date <= :freeze
+GROUP BY g.official, g.role
+""".format(ch=', '.join("'{}'".format(r) for r in CH_ROLES), age=AGE)
+
+# the officials ranked in one role (or NSO family), adding up every role that goes in the slot, the same as
+# combine_roles does (py_round is Python's round, as SQLite's ROUND can go the other way when the binary value is just
+# under a 5)
+RANKING = """
+SELECT o.name, o.refcert, o.nsocert, py_round(SUM(r.weight), 2) AS total, SUM(r.qualified)
+FROM role_weights r JOIN slots s ON s.role = r.role JOIN officials o ON o.id = r.official
+WHERE s.slot = :slot
+GROUP BY r.official
+HAVING total > 0
+ORDER BY total DESC, o.name
+LIMIT :limit
+"""
+
+
+def file_hash(filename):
+    """
+    :param filename: file location
+    :return: the SHA-1 of the file's contents, as a hex string
+    """
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), ''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class HistoryStore:
+    """A SQLite database of officials and their games, built up from history docs over any number of tournaments.
+    The whole history of each official is kept (independent of any freeze date), so they can be ranked, or loaded
+    back as Officials, at whatever freeze date a tournament needs.
+    Unsupported documents are recorded too (with the reason) so they are rejected without being reopened.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.create_function('py_round', 2, round)
+        self.db.executescript(SCHEMA)
+        self.added = 0
+        self.skipped = 0
+
+        # the roles that go into each role's slot: H roles go in with their CH role, and each NSO family has its roles
+        slots = [(r, r) for r in roles]
+        slots += [(h, ch) for ch, h in HEAD_ROLES]
+        slots += [(r, f) for r, f in ROLE_FAMILIES.items()]
+        with self.db:
+            self.db.executemany('INSERT INTO slots VALUES (?, ?)', slots)
+
+    def __repr__(self):
+        return "<History store %s, officials %d>" % (self.path, self.count())
+
+    def close(self):
+        self.db.close()
+
+    def count(self):
+        """
+        :return: number of officials in the store
+        """
+        return self.db.execute('SELECT COUNT(*) FROM officials').fetchone()[0]
+
+    def add(self, official, source=None, file_name=None):
+        """
+        Stores an official's whole history. If an official with the same name is already stored, their games are only
+        replaced when this history is at least as recent (its latest game is no older, and if it's the same day, it
+        has at least as many games), so ingesting an old doc after a newer one doesn't throw the newer games away
+        :param official: Official object (not compacted, as the whole history is needed)
+        :param source: hash of the history doc the official came from
+        :param file_name: name of the history doc
+        :return: the official's id in the store
+        """
+        if official.history is None:
+            raise ValueError(u'{} has been compacted without keeping the games'.format(official.name))
+        games = [(g.assn, g.type, g.role, g.date.isoformat(), g.primacy, g.event)
+                 for g in official.history if g.role is not None]
+        latest = (max([g[3] for g in games] or ['']), len(games))
+        with self.db:
+            row = self.db.execute('SELECT id FROM officials WHERE name = ?', (official.name,)).fetchone()
+            if row is None:
+                official_id = self.db.execute('INSERT INTO officials (name, refcert, nsocert, source) '
+                                              'VALUES (?, ?, ?, ?)',
+                                              (official.name, official.refcert, official.nsocert, source)).lastrowid
+                replace = True
+            else:
+                official_id = row[0]
+                stored = self.db.execute('SELECT MAX(date), COUNT(*) FROM games WHERE official = ?',
+                                         (official_id,)).fetchone()
+                replace = latest >= (stored[0] or '', stored[1])
+                if replace:
+                    self.db.execute('UPDATE officials SET refcert = ?, nsocert = ?, source = ? WHERE id = ?',
+                                    (official.refcert, official.nsocert, source, official_id))
+                    self.db.execute('DELETE FROM games WHERE official = ?', (official_id,))
+                else:
+                    print u'**** Keeping the more recent history already stored for {}'.format(official.name)
+            if replace:
+                self.db.executemany('INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    [(official_id,) + g for g in games])
+            if source is not None:
+                self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, NULL, ?)',
+                                (source, file_name, official_id, datetime.datetime.now().isoformat()))
+        return official_id
+
+    def ingest_file(self, filename):
+        """
+        Parses a history doc into the store, unless a doc with the same contents has been ingested already
+        :param filename: file location of the excel file
+        :return: reject reason, or None if the official is in the store
+        """
+        source = file_hash(filename)
+        row = self.db.execute('SELECT reason FROM sources WHERE hash = ?', (source,)).fetchone()
+        if row is not None:
+            self.skipped += 1
+            return row[0]
+
+        self.added += 1
+        off, reason = load_history(filename)
+        if off is None:
+            # files that crashed aren't recorded, so they're tried again next time
+            if reason == UNSUPPORTED:
+                with self.db:
+                    self.db.execute('INSERT INTO sources VALUES (?, ?, NULL, ?, ?)',
+                                    (source, filename, reason, datetime.datetime.now().isoformat()))
+            return reason
+        self.add(off, source, filename)
+        return None
+
+    def ingest_dir(self, history_dir):
+        """
+        Ingests the Officiating history excel files in the given directory (see list_history_files)
+        :param history_dir: directory name
+        :return: list of rejects (tuples of file name and reason)
+        """
+        rejects = []
+        for filename in list_history_files(history_dir):
+            reason = self.ingest_file(history_dir + '/' + filename)
+            if reason is not None:
+                rejects.append((filename, reason))
+        print self.summary()
+        return rejects
+
+    def summary(self):
+        """
+        :return: string with the number of docs ingested and skipped
+        """
+        return u'History store: {} docs ingested, {} already stored, {} officials'.format(self.added, self.skipped,
+                                                                                        self.count())
+
+    def officials(self, freezeDate=None, names=None):
+        """
+        Loads officials back out of the store
+        :param freezeDate: the date to measure the age of games (or None to leave it to be applied later)
+        :param names: list of names of the officials wanted (None for all of them)
+        :return: list of Officials, sorted by name
+        """
+        query = 'SELECT id, name, refcert, nsocert FROM officials'
+        params = ()
+        if names is not None:
+            query += ' WHERE name IN ({})'.format(', '.join('?' * len(names)))
+            params = tuple(names)
+        officials = {}
+        for official_id, name, refcert, nsocert in self.db.execute(query, params):
+            off = Official(name)
+            off.refcert = refcert
+            off.nsocert = nsocert
+            officials[official_id] = off
+        for official_id, assn, type, role, date, primacy, event in self.db.execute(
+                'SELECT official, assn, type, role, date, primacy, event FROM games ORDER BY rowid'):
+            off = officials.get(official_id)
+            if off is not None:
+                date = datetime.date(*[int(part) for part in date.split('-')])
+                off.add_game(Game(assn, type, role, None, primacy, date, event))
+        officials = sorted(officials.values(), key=lambda o: o.name)
+        if freezeDate is not None:
+            for off in officials:
+                off.apply_freeze_date(freezeDate)
+        return officials
+
+    def _weigh(self, model, freezeDate):
+        """
+        Fills the weights table from a weight model (one row per association, type, primacy, crew head or not, and
+        age), and works out every official's weighting in each role from it
+        :param model: WeightModel
+        :param freezeDate: the date to measure the age of games
+        :return: None
+        """
+        ages = len(model.decay)
+        weights, qualifies = model.tables(ages)
+        rows = []
+        for assn in assns:
+            for type in types:
+                for primacy in range(1, PRIMACIES + 1):
+                    for ch in (0, 1):
+                        for age in range(ages):
+                            i = len(rows)
+                            rows.append((assn, type, primacy, ch, age, weights[i], qualifies[i]))
+        with self.db:
+            self.db.execute('DELETE FROM weights')
+            self.db.executemany('INSERT INTO weights VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.execute('DELETE FROM role_weights')
+            self.db.execute(ROLE_WEIGHTS, {'freeze': freezeDate.isoformat(), 'ages': ages})
+
+    def _rank(self, role, limit):
+        if role not in roles and role not in config.nso_family:
+            raise ValueError(u'Unknown role {}'.format(role))
+        params = {'slot': role, 'limit': -1 if limit is None else limit}
+        ranked = []
+        for name, refcert, nsocert, weight, qualified in self.db.execute(RANKING, params):
+            ranked.append([name, refcert if role in config.ref_roles else nsocert, weight, qualified])
+        return ranked
+
+    def rank(self, model, role, freezeDate, limit=None):
+        """
+        Ranks the officials in the store in a role, like sort_by_role (officials with the same weighting are in name
+        order)
+        :param model: WeightModel
+        :param role: role (or NSO family) to be ranked by
+        :param freezeDate: the date to measure the age of games (later games are left out)
+        :param limit: number of officials wanted (None for all of them)
+        :return: list of role summaries (name, cert, weighted value, qualified games), highest weighted first
+        """
+        self._weigh(model, freezeDate)
+        return self._rank(role, limit)
+
+    def rankings(self, model, freezeDate, roles=config.ref_roles + config.nso_roles, limit=None):
+        """
+        Ranks the officials in the store in each role (see rank)
+        :param model: WeightModel
+        :param freezeDate: the date to measure the age of games
+        :param roles: roles (or NSO families) to be ranked by
+        :param limit: number of officials wanted in each role (None for all of them)
+        :return: dict of role: list of role summaries, highest weighted first
+        """
+        self._weigh(model, freezeDate)
+        return dict((r, self._rank(r, limit)) for r in roles)
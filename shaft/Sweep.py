@@ -0,0 +1,167 @@
+"""
+Sweeping the parameters of a weight model, to see how much the rankings move when the weights are tuned
+(like changing WFTDA Reg from 0.8 to 0.9). Every combination of the parameter values is scored against the whole pool
+in batches through a CountMatrix, and each role's ranking is compared with the base model's:
+    - rank correlation (Spearman, officials with the same score sharing the average rank)
+    - top N churn (how many of the base model's top N officials drop out of the top N)
+Parameters are named like the model's attributes: 'wgt.WFTDA.Reg', 'decay.1', 'ch_uplift', 'secondary_weight' or
+'tertiary_weight', for example:
+    results = shaft.sweep(o, w, {'wgt.WFTDA.Reg': [0.7, 0.8, 0.9, 1.0], 'decay.2': [0.3, 0.5, 0.7]})
+    header, rows = shaft.sweep_table(results)
+"""
+__author__ = 'hammer'
+
+import copy
+import itertools
+
+import config
+from Matrix import CountMatrix, _numpy
+
+roles = config.roles
+
+
+def set_parameter(model, name, value):
+    """
+    Sets a parameter of a weight model
+    :param model: WeightModel
+    :param name: parameter name, like 'wgt.WFTDA.Reg', 'decay.1' or 'ch_uplift'
+    :param value: the new value
+    :return: None
+    """
+    path = name.split('.')
+    if path[0] == 'wgt' and len(path) == 3:
+        model.wgt[path[1]][path[2]] = value
+    elif path[0] == 'decay' and len(path) == 2:
+        model.decay[int(path[1])] = value
+    elif len(path) == 1 and path[0] in ('ch_uplift', 'secondary_weight', 'tertiary_weight'):
+        setattr(model, path[0], value)
+    else:
+        raise ValueError(u'Unknown weight model parameter {}'.format(name))
+
+
+def grid_models(base, params):
+    """
+    Makes a copy of the base model for every combination of the parameter values
+    :param base: WeightModel to start from
+    :param params: dict of parameter name: list of values
+    :return: list of tuples (dict of parameter name: value, WeightModel)
+    """
+    names = sorted(params)
+    grid = []
+    for values in itertools.product(*[params[n] for n in names]):
+        model = copy.deepcopy(base)
+        settings = dict(zip(names, values))
+        for n in names:
+            set_parameter(model, n, settings[n])
+        model.name = base.name + ' ' + ', '.join(u'{}={}'.format(n, settings[n]) for n in names)
+        grid.append((settings, model))
+    return grid
+
+
+def _combine(weights):
+    """
+    Rounds off an array of officials x roles x models and merges H into CH, like combine_roles does (rounding keeps
+    officials with the same weighting tied, rather than ranked by the last binary place)
+    The weights are added up in a different order to apply_weight_models, so a score that lands right on a rounding
+    boundary can round the other way
+    """
+    numpy = _numpy()
+    weights = numpy.round(weights, 2)
+    weights[:, roles.index('CHR')] += weights[:, roles.index('HR')]
+    weights[:, roles.index('CHNSO')] += weights[:, roles.index('HNSO')]
+    return numpy.round(weights, 2)
+
+
+def _ranks(scores):
+    """
+    Ranks each column of an array of scores (officials x models), officials with the same score sharing the average
+    of their ranks
+    """
+    numpy = _numpy()
+    ranks = numpy.empty(scores.shape)
+    for j in range(scores.shape[1]):
+        column = scores[:, j]
+        ordered = numpy.sort(column)
+        ranks[:, j] = (numpy.searchsorted(ordered, column, 'left') + numpy.searchsorted(ordered, column, 'right') +
+                       1) / 2.0
+    return ranks
+
+
+def _spearman(base_ranks, ranks):
+    """
+    Rank correlation of the base ranks (officials) with each column of ranks (officials x models)
+    :return: array of correlations, one per model (nan where either ranking is all ties)
+    """
+    numpy = _numpy()
+    b = base_ranks - base_ranks.mean()
+    r = ranks - ranks.mean(axis=0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        return b.dot(r) / (numpy.sqrt((b * b).sum()) * numpy.sqrt((r * r).sum(axis=0)))
+
+
+def _top(scores, n):
+    """
+    :return: the set of positions of the top n officials with a score above 0 (ties in pool order, like sort_by_role)
+    """
+    numpy = _numpy()
+    order = numpy.argsort(-scores, kind='mergesort')
+    return set(i for i in order[:n].tolist() if scores[i] > 0)
+
+
+def sweep(officials, base, params, top_n=20, batch=100, matrix=None):
+    """
+    Scores the pool with every combination of the parameter values, and compares each role's ranking with the base
+    model's (CH and H merged, the same as the results sheets)
+    :param officials: list of Officials, with the freeze date applied
+    :param base: the WeightModel to start from
+    :param params: dict of parameter name: list of values
+    :param top_n: size of the top of each ranking to measure the churn of
+    :param batch: number of models scored in each matrix product
+    :param matrix: CountMatrix of the officials, if there's one already
+    :return: list of tuples (dict of parameter name: value, WeightModel, dict of role: (rank correlation, churn)),
+        one for each combination
+    """
+    if matrix is None:
+        matrix = CountMatrix(officials)
+    grid = grid_models(base, params)
+
+    weights, qualified = matrix.evaluate([base])
+    base_scores = _combine(weights)[:, :, 0]
+    base_ranks = [_ranks(base_scores[:, [r]])[:, 0] for r in range(len(roles))]
+    base_top = [_top(base_scores[:, r], top_n) for r in range(len(roles))]
+
+    results = []
+    for start in range(0, len(grid), batch):
+        chunk = grid[start:start + batch]
+        weights, qualified = matrix.evaluate([model for settings, model in chunk])
+        scores = _combine(weights)
+        stats = [{} for c in chunk]
+        for r, role in enumerate(roles):
+            rho = _spearman(base_ranks[r], _ranks(scores[:, r, :])).tolist()
+            for m in range(len(chunk)):
+                churn = len(base_top[r] - _top(scores[:, r, m], top_n))
+                stats[m][role] = (rho[m], churn)
+        for (settings, model), s in zip(chunk, stats):
+            results.append((settings, model, s))
+    return results
+
+
+def sweep_table(results, roles=config.ref_roles + config.nso_roles):
+    """
+    Lays out sweep results as a table, one row per combination of parameter values
+    :param results: list from sweep
+    :param roles: roles to include
+    :return: tuple of (header list, list of rows)
+    """
+    if not results:
+        return [], []
+    names = sorted(results[0][0])
+    header = names + [h for r in roles for h in (r + ' rank correlation', r + ' top churn')]
+    rows = []
+    for settings, model, stats in results:
+        row = [settings[n] for n in names]
+        for r in roles:
+            rho, churn = stats[r]
+            row += [round(rho, 4) if rho == rho else None, churn]
+        rows.append(row)
+    return header, rows
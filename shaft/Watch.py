@@ -0,0 +1,140 @@
+"""
+Watching a directory of history docs while applications are open, and keeping the pool of officials (and the
+results files) up to date as history docs are added, changed or removed
+"""
+__author__ = 'hammer'
+
+import os
+import time
+import datetime
+
+from Load import list_history_files, load_history
+from Save import create_results, create_rejects
+
+
+class HistoryWatcher:
+    """Keeps a pool of Officials in step with a directory of history docs.
+    Each poll compares the size and modification time of every history doc with the last poll, and only the files
+    that were added or changed are parsed again (and have the freeze date and weight models applied).
+    Officials from removed files are dropped from the pool.
+    """
+
+    def __init__(self, history_dir, freezeDate=datetime.date.today(), models=None, cache=None):
+        self.history_dir = history_dir
+        self.freezeDate = freezeDate
+        self.models = models or []
+        self.cache = cache
+        self.files = {}
+        self.officials = {}
+        self.rejects = {}
+
+    def __repr__(self):
+        return "<History watcher %s, officials %d, rejects %d>" % (self.history_dir, len(self.officials),
+                                                                   len(self.rejects))
+
+    def scan(self):
+        """
+        Looks at the history docs currently in the directory
+        :return: dict of file name: (size, modification time)
+        """
+        files = {}
+        for filename in list_history_files(self.history_dir):
+            try:
+                stat = os.stat(os.path.join(self.history_dir, filename))
+            except OSError:
+                # the file went away between listing the directory and looking at it
+                continue
+            files[filename] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def load(self, filename):
+        """
+        (Re)loads a single history doc into the pool, applying the freeze date and weight models
+        :param filename: file name (without the directory)
+        :return: None
+        """
+        self.officials.pop(filename, None)
+        self.rejects.pop(filename, None)
+        off, reason = load_history(self.history_dir + '/' + filename, self.cache)
+        if off is None:
+            self.rejects[filename] = reason
+        else:
+            off.apply_freeze_date(self.freezeDate)
+            off.apply_weight_models(self.models)
+            self.officials[filename] = off
+
+    def poll(self):
+        """
+        Checks the directory for added, changed and removed history docs, and updates the pool to match
+        :return: tuple of lists of file names (added, changed, removed)
+        """
+        files = self.scan()
+        added = sorted(f for f in files if f not in self.files)
+        changed = sorted(f for f in files if f in self.files and files[f] != self.files[f])
+        removed = sorted(f for f in self.files if f not in files)
+
+        for filename in added + changed:
+            self.load(filename)
+        for filename in removed:
+            self.officials.pop(filename, None)
+            self.rejects.pop(filename, None)
+
+        self.files = files
+        return added, changed, removed
+
+    def get_officials(self):
+        """
+        :return: list of Officials in the pool, in file name order
+        """
+        return [self.officials[f] for f in sorted(self.officials)]
+
+    def get_rejects(self):
+        """
+        :return: list of tuples (history file, reject reason), in file name order
+        """
+        return [(f, self.rejects[f]) for f in sorted(self.rejects)]
+
+    def watch(self, on_change, interval=60, max_polls=None):
+        """
+        Polls the directory until interrupted, calling on_change whenever something has actually changed
+        :param on_change: function taking the HistoryWatcher, called after each poll that found a change
+        :param interval: seconds to wait between polls
+        :param max_polls: stop after this many polls (None to keep going)
+        :return: None
+        """
+        polls = 0
+        while max_polls is None or polls < max_polls:
+            if polls > 0:
+                time.sleep(interval)
+            added, changed, removed = self.poll()
+            polls += 1
+            if added or changed or removed:
+                print u'{}: {} added, {} changed, {} removed'.format(datetime.datetime.now(), len(added),
+                                                                     len(changed), len(removed))
+                on_change(self)
+
+
+def watch_dir(history_dir, filename_base, models, freezeDate=datetime.date.today(), interval=60, cache=None,
+              max_polls=None):
+    """
+    Watches a directory of history docs and rewrites the results files (one per weight model, plus the rejects file)
+    every time a history doc is added, changed or removed
+    :param history_dir: directory name
+    :param filename_base: start of the results file names, like the tournament scripts use
+    :param models: list of WeightModels to rank the officials with
+    :param freezeDate: the date to measure the age of games
+    :param interval: seconds to wait between checks of the directory
+    :param cache: optional HistoryCache to skip parsing unchanged files on the first pass
+    :param max_polls: stop after this many checks (None to keep going)
+    :return: the HistoryWatcher, holding the final pool
+    """
+    def write_results(watcher):
+        # written even when the last history doc has gone, so the old rankings don't hang around
+        officials = watcher.get_officials()
+        for w in models:
+            create_results(filename_base + '-' + w.name + '.xlsx', officials, w)
+        create_rejects(filename_base + '-rejects.xlsx', watcher.get_rejects())
+
+    watcher = HistoryWatcher(history_dir, freezeDate, models, cache)
+    watcher.watch(write_results, interval, max_polls)
+    return watcher
@@ -0,0 +1,146 @@
+"""
+Writers for the results files, so the same rows can be saved as xlsx (for people to read) or as plain CSV, TSV or
+JSON lines (much faster to write, for big dumps like the raw games)
+A writer hands out a tab at a time, and each tab's rows are streamed straight to disk as they're added:
+    out = open_writer('results.csv', 'csv')
+    tab = out.sheet('Applicants', ['Name', 'Ref Cert'])
+    tab.append(['Mike Hammer', 2])
+    out.close()
+xlsx puts all the tabs in the one file. The other formats write the first tab to the file name given, and each other
+tab to a file of its own, named after the tab: results-THR.csv, results-CHR.csv and so on
+More formats can be added to WRITERS
+"""
+__author__ = 'hammer'
+
+import os
+import csv
+import json
+import datetime
+import collections
+
+from openpyxl import Workbook
+
+
+class XlsxWriter:
+    """All the tabs in one workbook, written in openpyxl's write-only mode"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.wb = Workbook(write_only=True)
+
+    def sheet(self, title, header=None):
+        ws = self.wb.create_sheet(title)
+        if header is not None:
+            ws.append(header)
+        return ws
+
+    def close(self):
+        self.wb.save(self.file_name)
+
+
+def _tab_file_name(file_name, title, first):
+    """
+    :return: the file name for a tab (the file name given for the first tab, named after the tab for the rest)
+    """
+    if first:
+        return file_name
+    base, ext = os.path.splitext(file_name)
+    return u'{}-{}{}'.format(base, title, ext)
+
+
+def _text(value):
+    """
+    Turns a cell value into text for CSV (UTF-8 encoded, as the csv module only takes bytes)
+    """
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if not isinstance(value, unicode):
+        value = unicode(value)
+    return value.encode('utf-8')
+
+
+class _CsvSheet:
+    def __init__(self, f, delimiter):
+        self.f = f
+        self.writer = csv.writer(f, delimiter=delimiter, lineterminator='\n')
+
+    def append(self, row):
+        self.writer.writerow([_text(v) for v in row])
+
+
+class CsvWriter:
+    """A delimited text file for each tab (comma separated by default)"""
+    delimiter = ','
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.files = []
+
+    def sheet(self, title, header=None):
+        f = open(_tab_file_name(self.file_name, title, not self.files), 'wb')
+        self.files.append(f)
+        sheet = _CsvSheet(f, self.delimiter)
+        if header is not None:
+            sheet.append(header)
+        return sheet
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+class TsvWriter(CsvWriter):
+    """A tab separated text file for each tab"""
+    delimiter = '\t'
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(repr(value) + ' is not JSON serializable')
+
+
+class _JsonLinesSheet:
+    def __init__(self, f, header):
+        self.f = f
+        self.header = header
+
+    def append(self, row):
+        if self.header is not None:
+            row = collections.OrderedDict(zip(self.header, row))
+        self.f.write(json.dumps(row, default=_json_value) + '\n')
+
+
+class JsonLinesWriter:
+    """A JSON lines file for each tab: one object per row keyed by the tab's header (or a list for tabs without one)"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.files = []
+
+    def sheet(self, title, header=None):
+        f = open(_tab_file_name(self.file_name, title, not self.files), 'wb')
+        self.files.append(f)
+        return _JsonLinesSheet(f, header)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+
+
+WRITERS = {'xlsx': XlsxWriter, 'csv': CsvWriter, 'tsv': TsvWriter, 'jsonl': JsonLinesWriter}
+
+
+def open_writer(file_name, format='xlsx'):
+    """
+    :param file_name: the name of the file to output
+    :param format: one of the formats in WRITERS ('xlsx', 'csv', 'tsv' or 'jsonl')
+    :return: a writer, with sheet(title, header) to start each tab and close() to finish
+    """
+    if format not in WRITERS:
+        raise ValueError(u'Unknown format {} (should be one of {})'.format(format, ', '.join(sorted(WRITERS))))
+    return WRITERS[format](file_name)
@@ -0,0 +1,320 @@
+"""
+Reading the cell values out of an exported history document, using one of two readers with the same interface:
+ 1/ XlsxReader streams the sheet XML straight out of the xlsx file (fast, made for the known history doc layouts)
+ 2/ WorkbookReader wraps an openpyxl workbook (slower, but copes with anything openpyxl can open)
+Both hand back plain values (strings, numbers, datetimes) rather than cell objects
+"""
+__author__ = 'hammer'
+
+import re
+import zipfile
+import posixpath
+import xml.etree.cElementTree as ElementTree
+
+from openpyxl import load_workbook
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format
+from openpyxl.utils.datetime import from_excel, from_ISO8601, CALENDAR_WINDOWS_1900, CALENDAR_MAC_1904
+
+import config
+
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+DOC_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+HISTORY_COLUMNS = config.history_columns
+
+CELL_REF = re.compile(r'^([A-Z]+)(\d+)$')
+
+
+def split_ref(ref):
+    """
+    Splits a cell reference into its column and row
+    :param ref: cell reference such as 'C4'
+    :return: tuple of (column index counting from 0, row number counting from 1)
+    """
+    match = CELL_REF.match(ref.upper())
+    if match is None:
+        raise ValueError(u'invalid cell reference: {}'.format(ref))
+    col = 0
+    for letter in match.group(1):
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return col - 1, int(match.group(2))
+
+
+def _cast_number(text):
+    """
+    Converts a number stored as text into an int or float, the same way openpyxl does
+    :param text: string from the sheet XML
+    :return: int or float
+    """
+    if '.' in text or 'E' in text or 'e' in text:
+        return float(text)
+    return int(text)
+
+
+class XlsxReader:
+    """Reads cell values directly out of the XML inside an xlsx file.
+    Shared strings and styles are read once, and each sheet is streamed with iterparse, keeping only the columns
+    asked for, so no cell objects are built and nothing is resolved that the history parser doesn't use.
+    Numbers in date formatted cells are converted to datetimes, like openpyxl does.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.archive = zipfile.ZipFile(filename)
+        self.epoch = CALENDAR_WINDOWS_1900
+        self._sheets = None
+        self._parts = {}
+        self._strings = None
+        self._string_items = None
+        self._date_styles = None
+        self._cells = {}
+
+    def __repr__(self):
+        return "<Xlsx reader %s>" % self.filename
+
+    def close(self):
+        self.archive.close()
+
+    def _rels(self, part):
+        """
+        Reads the relationships of a part of the package
+        :param part: name of the part, such as 'xl/workbook.xml'
+        :return: dict of relationship id: (type, target part name)
+        """
+        folder, name = posixpath.split(part)
+        rels = {}
+        try:
+            root = ElementTree.fromstring(self.archive.read(posixpath.join(folder, '_rels', name + '.rels')))
+        except KeyError:
+            return rels
+        for rel in root.iter(PKG_REL_NS + 'Relationship'):
+            target = rel.get('Target')
+            if target.startswith('/'):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(posixpath.join(folder, target))
+            rels[rel.get('Id')] = (rel.get('Type'), target)
+        return rels
+
+    def sheet_names(self):
+        """
+        Reads the names of the sheets from the workbook catalog (without touching any of the sheets)
+        :return: list of sheet names
+        """
+        if self._sheets is None:
+            workbook = 'xl/workbook.xml'
+            for rel_type, target in self._rels('').values():
+                if rel_type.endswith('/officeDocument'):
+                    workbook = target
+            root = ElementTree.fromstring(self.archive.read(workbook))
+            if root.tag != SHEET_NS + 'workbook':
+                raise ValueError(u'unrecognized workbook format: {}'.format(root.tag))
+            props = root.find(SHEET_NS + 'workbookPr')
+            if props is not None and props.get('date1904') in ('1', 'true'):
+                self.epoch = CALENDAR_MAC_1904
+
+            rels = self._rels(workbook)
+            self._sheets = []
+            for sheet in root.iter(SHEET_NS + 'sheet'):
+                self._sheets.append(sheet.get('name'))
+                self._parts[sheet.get('name')] = rels[sheet.get(DOC_REL_NS + 'id')][1]
+            for rel_type, target in rels.values():
+                if rel_type.endswith('/sharedStrings'):
+                    self._parts['[strings]'] = target
+                elif rel_type.endswith('/styles'):
+                    self._parts['[styles]'] = target
+        return self._sheets
+
+    def _string(self, index):
+        """
+        Looks up a shared string. The string table is only read as far as the highest index asked for so far, so
+        checking a cell or two doesn't cost reading every string in the workbook
+        :param index: position in the shared string table
+        :return: string
+        """
+        if self._strings is None:
+            self._strings = []
+            if '[strings]' in self._parts:
+                self._string_items = ElementTree.iterparse(self.archive.open(self._parts['[strings]']))
+            else:
+                self._string_items = iter([])
+        if len(self._strings) > index:
+            return self._strings[index]
+        for event, si in self._string_items:
+            if si.tag != SHEET_NS + 'si':
+                continue
+            # either plain text, or a list of rich text runs (phonetic runs are left out)
+            text = si.find(SHEET_NS + 't')
+            if text is not None:
+                self._strings.append(text.text or u'')
+            else:
+                self._strings.append(u''.join(t.text or u'' for t in si.findall(SHEET_NS + 'r/' + SHEET_NS + 't')))
+            si.clear()
+            if len(self._strings) > index:
+                break
+        return self._strings[index]
+
+    def _read_date_styles(self):
+        """
+        Reads the cell styles (once, and only when a styled number turns up) to find out which ones are dates
+        :return: set of the style indexes that are dates
+        """
+        if self._date_styles is None:
+            self._date_styles = set()
+            if '[styles]' in self._parts:
+                root = ElementTree.fromstring(self.archive.read(self._parts['[styles]']))
+                formats = dict(BUILTIN_FORMATS)
+                for fmt in root.iter(SHEET_NS + 'numFmt'):
+                    formats[int(fmt.get('numFmtId'))] = fmt.get('formatCode')
+                xfs = root.find(SHEET_NS + 'cellXfs')
+                if xfs is not None:
+                    for i, xf in enumerate(xfs.findall(SHEET_NS + 'xf')):
+                        if is_date_format(formats.get(int(xf.get('numFmtId', 0)))):
+                            self._date_styles.add(i)
+        return self._date_styles
+
+    def _value(self, c):
+        """
+        Converts a cell element from the sheet XML into its value
+        :param c: the <c> element
+        :return: the value (None for an empty cell)
+        """
+        t = c.get('t', 'n')
+        if t == 'inlineStr':
+            inline = c.find(SHEET_NS + 'is')
+            if inline is None:
+                return None
+            text = inline.find(SHEET_NS + 't')
+            if text is not None:
+                return text.text or u''
+            return u''.join(r.text or u'' for r in inline.findall(SHEET_NS + 'r/' + SHEET_NS + 't'))
+
+        v = c.find(SHEET_NS + 'v')
+        if v is None or v.text is None:
+            return None
+        if t == 's':
+            return self._string(int(v.text))
+        elif t == 'n':
+            value = _cast_number(v.text)
+            if c.get('s') is not None and int(c.get('s')) in self._read_date_styles():
+                return from_excel(value, self.epoch)
+            return value
+        elif t == 'b':
+            return v.text == '1'
+        elif t == 'd':
+            return from_ISO8601(v.text)
+        else:
+            # 'str' formula results and 'e' errors are kept as text
+            return v.text
+
+    def iter_rows(self, sheet, max_col=HISTORY_COLUMNS):
+        """
+        Streams the rows of a sheet
+        :param sheet: name of the sheet
+        :param max_col: number of columns to read, starting at A
+        :return: generator of (row number, tuple of max_col values), skipping rows that aren't in the file at all
+        """
+        self.sheet_names()
+        cell_tag = SHEET_NS + 'c'
+        row_tag = SHEET_NS + 'row'
+        row_number = 0
+        values = [None] * max_col
+        col = -1
+        for event, elem in ElementTree.iterparse(self.archive.open(self._parts[sheet])):
+            if elem.tag == cell_tag:
+                ref = elem.get('r')
+                if ref is not None:
+                    col = split_ref(ref)[0]
+                else:
+                    col += 1
+                if col < max_col:
+                    values[col] = self._value(elem)
+            elif elem.tag == row_tag:
+                row_number = int(elem.get('r', row_number + 1))
+                yield row_number, tuple(values)
+                values = [None] * max_col
+                col = -1
+                elem.clear()
+
+    def rows(self, sheet, min_row=1, max_col=HISTORY_COLUMNS):
+        """
+        Returns the values of every row of a sheet from min_row on (including blank rows)
+        The sheet is only read as far as the caller takes rows, so stopping early skips the rest of the XML
+        :param sheet: name of the sheet
+        :param min_row: first row to return
+        :param max_col: number of columns to read, starting at A
+        :return: generator of tuples of max_col values
+        """
+        blank = (None,) * max_col
+        last = min_row - 1
+        for row_number, values in self.iter_rows(sheet, max_col):
+            if row_number < min_row:
+                continue
+            for i in xrange(last + 1, row_number):
+                yield blank
+            last = row_number
+            yield values
+
+    def cell(self, sheet, ref):
+        """
+        Returns the value of a single cell, only reading the sheet as far as that row
+        Cells read along the way are remembered, so several cells near the top of a sheet cost a single pass
+        :param sheet: name of the sheet
+        :param ref: cell reference such as 'C4'
+        :return: the value of the cell
+        """
+        return self.cells(sheet, [ref])[0]
+
+    def cells(self, sheet, refs):
+        """
+        Returns the values of several cells, with a single pass over the sheet (as far as the lowest row asked for)
+        :param sheet: name of the sheet
+        :param refs: list of cell references such as ['A1', 'A104']
+        :return: list of values, in the same order as refs
+        """
+        positions = [split_ref(ref) for ref in refs]
+        cells, last_row, width = self._cells.get(sheet, ({}, 0, 0))
+        max_row = max(row for col, row in positions)
+        max_width = max(col for col, row in positions) + 1
+        if max_row > last_row or max_width > width:
+            cells = {}
+            width = max(max_width, width, HISTORY_COLUMNS)
+            for row_number, values in self.iter_rows(sheet, width):
+                if row_number > max_row:
+                    break
+                cells[row_number] = values
+            last_row = max(max_row, last_row)
+            self._cells[sheet] = (cells, last_row, width)
+        return [cells[row][col] if row in cells else None for col, row in positions]
+
+
+class WorkbookReader:
+    """Reads cell values out of a workbook opened by openpyxl (read only), as the fallback for odd files
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.wb = load_workbook(filename, data_only=True, read_only=True)
+
+    def __repr__(self):
+        return "<Workbook reader %s>" % self.filename
+
+    def close(self):
+        if hasattr(self.wb, 'close'):
+            self.wb.close()
+
+    def sheet_names(self):
+        return self.wb.get_sheet_names()
+
+    def rows(self, sheet, min_row=1, max_col=HISTORY_COLUMNS):
+        blank = (None,) * max_col
+        for row in self.wb[sheet].iter_rows(min_row=min_row, max_col=max_col):
+            values = tuple(c.value for c in row[:max_col])
+            yield values + blank[len(values):]
+
+    def cell(self, sheet, ref):
+        return self.wb[sheet][ref].value
+
+    def cells(self, sheet, refs):
+        return [self.wb[sheet][ref].value for ref in refs]
@@ -2,11 +2,18 @@
 
 We have several parts:
 - load an official from an exported Excel file (old not yet accepted but new formats accepted)
-- load an official from live google sheets (not implemented)
+- load an official from live google sheets
 - summarise a list of officials from a given directory
+- cache the parsed officials so unchanged history docs aren't parsed again
+- keep officials and their games from every tournament in a SQLite store, and rank them from it
+- watch a directory of history docs and keep the results up to date as they change
 - standard options for processing
+- weigh a whole pool against many weight models at once (with NumPy)
+- query a pool of officials by cert, tallies and weighting, with indexes
+- sweep weight model parameters and report how much the rankings move
 - process tournament application sheets (not implemented)
-- save sheet summarizing officials
+- save sheet summarizing officials (or CSV, TSV or JSON lines files)
+- save the officials and games as columns (pandas DataFrames, Parquet or Arrow files), for analysis elsewhere
 """
 __author__ = 'hammer'
 __version__ = 0.5
@@ -22,12 +29,33 @@ from shaft.Offical import WeightModel
 from shaft.Offical import filtertest
 from shaft.Offical import create_weights
 from shaft.Offical import sort_by_role
+from shaft.Offical import Leaderboard
+from shaft.Offical import weigh_officials
+from shaft.Offical import weighting_series
+from shaft.Matrix import CountMatrix
+from shaft.Matrix import matrix_weight_models
+from shaft.Query import Pool
+from shaft.Sweep import sweep
+from shaft.Sweep import sweep_table
 from shaft.Load import load_file
 from shaft.Load import load_files_from_dir
+from shaft.Load import iter_files_from_dir
+from shaft.Load import load_google_sheet
+from shaft.Load import load_google_sheets
+from shaft.Sheets import SheetsClient
+from shaft.Cache import HistoryCache
+from shaft.Store import HistoryStore
 from shaft.Save import create_results
 from shaft.Save import create_raw_results
 from shaft.Save import create_rejects
 from shaft.Save import create_events
+from shaft.Writers import open_writer
+from shaft.Columns import to_frames
+from shaft.Columns import to_arrow
+from shaft.Columns import create_parquet
+from shaft.Columns import create_arrow
+from shaft.Watch import HistoryWatcher
+from shaft.Watch import watch_dir
 from shaft.config import roles, ref_roles, nso_roles, nso_family
 
 
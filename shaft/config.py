@@ -17,3 +17,17 @@ nso_family['pm'] = ['PBM', 'PBT', 'LT']
 nso_roles = ['THNSO'] + nso_family['ch'] + nso_family['pt'] + nso_family['st'] + nso_family['pm'] + ['HNSO', 'NALT']
 
 roles = ref_roles + nso_roles
+
+"""
+History doc layout: the game tabs start with 3 header rows, the game data is in columns A-J,
+and scanning a tab stops after this many rows in a row without a date (the templates are formatted far past the data)
+"""
+history_header_rows = 3
+history_columns = 10
+history_blank_rows = 50
+
+"""
+Counting games by age: games this many years old or older are all counted together (weight model age decays can't be
+longer than this when weighting from counts)
+"""
+age_buckets = 10